@@ -6,9 +6,13 @@ from streamlit_cookies_manager import EncryptedCookieManager
 from src.ui.auth_pages import show_login_page, show_signup_page, show_reset_page
 from src.ui.profile_page import show_profile_page
 from src.ui.expense_page import show_expense_page
-from src.expense_manager import get_expenses_as_df
+from src.expense_manager import get_expenses_as_df, flush_mutations
 from src.ui.dashboard_page import show_dashboard_page
 from src.ui.chatbot_page import show_chatbot_page
+from src.schema import ensure_schema
+from src.auth import get_user_profile
+from src.monthly_reports import start_report_scheduler
+from src.profiling import profile_section
 
 # --- COOKIE SETUP ---
 cookie_secret = st.secrets["cookie"]["secret"]
@@ -20,19 +24,40 @@ if not cookies.ready():
 def set_active_tab(tab_name):
     st.session_state.active_tab = tab_name
 
+def clear_auth_cookies():
+    cookies["user_id"] = ""
+    cookies["email"] = ""
+    cookies["username"] = ""
+    cookies.save()
+
 def main():
     st.set_page_config(page_title="Smart Expense Tracker", layout="wide")
+    ensure_schema()
+    start_report_scheduler()
     
     # Initialize session state
     if "auth_page" not in st.session_state: st.session_state.auth_page = "login"
     if "user_id" not in st.session_state: st.session_state.user_id = None
     if "active_tab" not in st.session_state: st.session_state.active_tab = "Expense"
 
-    # Restore session from cookies if needed
+    # Restore session from cookies if needed, trusting them only if they match the database
     if not st.session_state.user_id and cookies.get("user_id"):
-        st.session_state.user_id = cookies.get("user_id")
-        st.session_state.email = cookies.get("email")
-        st.session_state.username = cookies.get("username")
+        profile = get_user_profile(cookies.get("user_id"))
+        if profile and profile["email"] == cookies.get("email"):
+            st.session_state.user_id = profile["user_id"]
+        else:
+            clear_auth_cookies()
+
+    # Serve the cached profile to every page; drop the session if the account is gone
+    if st.session_state.user_id:
+        profile = get_user_profile(st.session_state.user_id)
+        if profile is None:
+            clear_auth_cookies()
+            st.session_state.user_id = None
+        else:
+            st.session_state.profile = profile
+            st.session_state.email = profile["email"]
+            st.session_state.username = profile["username"]
 
     # --- AUTHENTICATION FLOW ---
     if not st.session_state.user_id:
@@ -76,16 +101,15 @@ def main():
 
         st.markdown("<div style='height: 30vh;'></div>", unsafe_allow_html=True)
         if st.button("Logout", use_container_width=True):
-            cookies["user_id"] = ""
-            cookies["email"] = ""
-            cookies["username"] = ""
-            cookies.save()
+            # make sure queued expense writes are durable before the session ends
+            flush_mutations()
+            clear_auth_cookies()
             # st.session_state.clear() # Clear all session state
             # get_expenses_as_df.clear() # Clear data cache
             # st.rerun()
             
             # clear only auth-related session state keys (avoid clearing internal cookie manager state)
-            for k in ["user_id", "email", "username", "auth_page", "active_tab"]:
+            for k in ["user_id", "email", "username", "profile", "auth_page", "active_tab"]:
                 if k in st.session_state:
                     del st.session_state[k]
 
@@ -99,16 +123,18 @@ def main():
             st.rerun()
 
     # --- RENDER ACTIVE TAB ---
-    if st.session_state.active_tab == "Expense":
-        show_expense_page()
-    elif st.session_state.active_tab == "Dashboard":
-        # st.markdown("## 📈 Dashboard (Coming Soon...)")
-        show_dashboard_page()
-    elif st.session_state.active_tab == "Chatbot":
-        # st.markdown("## 🤖 Chatbot (Coming Soon...)")
-        show_chatbot_page()
-    elif st.session_state.active_tab == "User Profile":
-        show_profile_page(cookies)
+    with profile_section(st.session_state.active_tab.lower().replace(" ", "_")):
+        if st.session_state.active_tab == "Expense":
+            show_expense_page()
+        elif st.session_state.active_tab == "Dashboard":
+            # st.markdown("## 📈 Dashboard (Coming Soon...)")
+            show_dashboard_page()
+        elif st.session_state.active_tab == "Chatbot":
+            # st.markdown("## 🤖 Chatbot (Coming Soon...)")
+            show_chatbot_page()
+        elif st.session_state.active_tab == "User Profile":
+            show_profile_page(cookies)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with profile_section("rerun"):
+        main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+# src/anomaly_detector.py
+"""Streaming per-category spending anomaly detection.
+
+For every (user, category) we keep an exponentially weighted mean and
+variance of log(1 + amount in USD). Each new expense is scored against the
+statistics as they stood before it, then folded in, both O(1). Expenses
+scoring above `THRESHOLD` standard deviations are recorded in
+`expense_anomalies`, so pages and the chatbot never rescan history. An
+edited expense is scored again against the current statistics, without
+being folded in a second time.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from psycopg2.extras import execute_values
+from src.database import get_connection
+from src.utils import convert_to_currency, KHR_TO_USD
+
+ALPHA = 0.1  # weight of the newest observation
+THRESHOLD = 3.0
+MIN_OBSERVATIONS = 5
+
+def _score(x, observations, mean, var):
+    if observations < MIN_OBSERVATIONS or var <= 0:
+        return None
+    return (x - mean) / np.sqrt(var)
+
+def _to_log_usd(amount, currency):
+    amount_usd = float(convert_to_currency(float(amount), currency, "USD"))
+    return amount_usd, float(np.log1p(amount_usd))
+
+def _flag(cursor, item_id, user_id, entry_date, category_label, merchant_name, amount_usd, mean, score):
+    cursor.execute("""
+        INSERT INTO expense_anomalies (item_id, user_id, entry_date, category_label, merchant_name, amount_usd, expected_usd, score)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (item_id) DO NOTHING
+    """, (str(item_id), user_id, entry_date, category_label, merchant_name, amount_usd, float(np.expm1(mean)), float(score)))
+
+def observe_expense(cursor, item_id, user_id, entry_date, category_label, merchant_name, amount, currency):
+    """Scores one new expense and updates its category's running statistics."""
+    amount_usd, x = _to_log_usd(amount, currency)
+    cursor.execute("""
+        SELECT observations, ewm_mean, ewm_var FROM category_stats
+        WHERE user_id = %s AND category_label = %s
+        FOR UPDATE
+    """, (user_id, category_label))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("""
+            INSERT INTO category_stats (user_id, category_label, observations, ewm_mean, ewm_var)
+            VALUES (%s, %s, 1, %s, 0)
+        """, (user_id, category_label, x))
+        return None
+
+    observations, mean, var = row
+    score = _score(x, observations, mean, var)
+    if score is not None and score > THRESHOLD:
+        _flag(cursor, item_id, user_id, entry_date, category_label, merchant_name, amount_usd, mean, score)
+
+    diff = x - mean
+    cursor.execute("""
+        UPDATE category_stats
+        SET observations = observations + 1, ewm_mean = %s, ewm_var = %s
+        WHERE user_id = %s AND category_label = %s
+    """, (mean + ALPHA * diff, (1 - ALPHA) * (var + ALPHA * diff * diff), user_id, category_label))
+    return score
+
+def forget_anomaly(cursor, item_id):
+    """Drops the flag of a deleted expense (the running statistics are kept)."""
+    cursor.execute("DELETE FROM expense_anomalies WHERE item_id = %s", (str(item_id),))
+
+def rescore_expense(cursor, item_id, user_id, entry_date, category_label, merchant_name, amount, currency):
+    """Re-flags an edited expense against its category's current statistics, which are left unchanged."""
+    forget_anomaly(cursor, item_id)
+    amount_usd, x = _to_log_usd(amount, currency)
+    cursor.execute("""
+        SELECT observations, ewm_mean, ewm_var FROM category_stats
+        WHERE user_id = %s AND category_label = %s
+    """, (user_id, category_label))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    observations, mean, var = row
+    score = _score(x, observations, mean, var)
+    if score is not None and score > THRESHOLD:
+        _flag(cursor, item_id, user_id, entry_date, category_label, merchant_name, amount_usd, mean, score)
+    return score
+
+def rebuild_anomaly_stats(cursor, user_id=None):
+    """Recomputes statistics and flags from history in one vectorized pass."""
+    user_filter, params = ("WHERE user_id = %s", (user_id,)) if user_id else ("", ())
+    cursor.execute(f"""
+        SELECT item_id::text, user_id, entry_date, category_label, merchant_name, amount::float, currency
+        FROM expenses {user_filter}
+        ORDER BY user_id, category_label, entry_date
+    """, params)
+    df = pd.DataFrame(cursor.fetchall(), columns=["item_id", "user_id", "entry_date", "category_label", "merchant_name", "amount", "currency"])
+    cursor.execute(f"DELETE FROM category_stats {user_filter}", params)
+    cursor.execute(f"DELETE FROM expense_anomalies {user_filter}", params)
+    if df.empty:
+        return
+
+    df["amount_usd"] = np.where(df["currency"] == "KHR", df["amount"] / KHR_TO_USD, df["amount"])
+    df["x"] = np.log1p(df["amount_usd"])
+    df["x2"] = df["x"] ** 2
+    keys = ["user_id", "category_label"]
+    groups = df.groupby(keys, sort=False)
+    # adjust=False matches the streaming recurrence; its variance is E[x^2] - E[x]^2
+    ewm = groups[["x", "x2"]].ewm(alpha=ALPHA, adjust=False).mean().reset_index(level=keys, drop=True)
+    df["mean"] = ewm["x"]
+    df["var"] = (ewm["x2"] - ewm["x"] ** 2).clip(lower=0)
+    df["observations"] = groups.cumcount() + 1
+
+    prev_mean = df.groupby(keys, sort=False)["mean"].shift()
+    prev_var = df.groupby(keys, sort=False)["var"].shift()
+    scorable = (df["observations"] > MIN_OBSERVATIONS) & (prev_var > 0)
+    df["score"] = np.where(scorable, (df["x"] - prev_mean) / np.sqrt(prev_var.where(prev_var > 0, 1)), np.nan)
+    df["expected_usd"] = np.expm1(prev_mean)
+
+    last = df.groupby(keys, sort=False).tail(1)
+    execute_values(cursor, """
+        INSERT INTO category_stats (user_id, category_label, observations, ewm_mean, ewm_var) VALUES %s
+    """, list(last[["user_id", "category_label", "observations", "mean", "var"]].itertuples(index=False, name=None)))
+
+    flagged = df[df["score"] > THRESHOLD]
+    if not flagged.empty:
+        execute_values(cursor, """
+            INSERT INTO expense_anomalies (item_id, user_id, entry_date, category_label, merchant_name, amount_usd, expected_usd, score) VALUES %s
+        """, list(flagged[["item_id", "user_id", "entry_date", "category_label", "merchant_name", "amount_usd", "expected_usd", "score"]].itertuples(index=False, name=None)))
+
+@st.cache_data
+def get_expense_anomalies(user_id, start_date, end_date):
+    """`{item_id: {"score", "expected_usd"}}` for flagged expenses in the range."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT item_id, score, expected_usd FROM expense_anomalies
+        WHERE user_id = %s AND entry_date BETWEEN %s AND %s
+    """, (user_id, start_date, end_date))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return {item_id: {"score": score, "expected_usd": expected} for item_id, score, expected in rows}
+
+def get_recent_anomalies(user_id, since, limit=5):
+    """Most unusual flagged expenses since `since`, strongest first."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT entry_date, category_label, merchant_name, amount_usd, expected_usd, score
+        FROM expense_anomalies
+        WHERE user_id = %s AND entry_date >= %s
+        ORDER BY score DESC
+        LIMIT %s
+    """, (user_id, since, limit))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
@@ -0,0 +1,84 @@
+# src/async_data.py
+"""Concurrent read queries over the pooled SQLAlchemy engine.
+
+A page hands `fetch_concurrently` its independent queries and waits on them
+together, so its latency is the slowest query rather than the sum of all of
+them. Each query carries its own timeout, enforced server-side with
+`statement_timeout`; when one query fails or the batch overruns, the rest
+are cancelled (pending ones are dropped, running ones get a PostgreSQL
+cancel request).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import pandas as pd
+from src.database import get_db_engine
+
+MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 10  # seconds, per query
+CANCEL_GRACE = 2  # seconds to wait past the longest timeout before cancelling client-side
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="db-read")
+
+class _QueryHandle:
+    """Tracks the raw DBAPI connection a running query is using, so it can be cancelled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._raw = None
+        self.cancelled = False
+
+    def attach(self, raw):
+        with self._lock:
+            self._raw = raw
+            return not self.cancelled
+
+    def detach(self):
+        with self._lock:
+            self._raw = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._raw is not None:
+                try:
+                    self._raw.cancel()
+                except Exception:
+                    pass
+
+def _run_query(engine, query, params, timeout, handle):
+    with engine.connect() as conn:
+        if not handle.attach(conn.connection.dbapi_connection):
+            return None
+        try:
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+            return pd.read_sql_query(query, conn, params=params)
+        finally:
+            handle.detach()
+
+def fetch_concurrently(queries, timeout=DEFAULT_TIMEOUT):
+    """Runs `{name: (sql, params[, timeout])}` concurrently and returns `{name: DataFrame}`.
+
+    Raises the first query error (or TimeoutError) after cancelling the others.
+    """
+    engine = get_db_engine()
+    futures, handles, longest = {}, {}, 0
+    for name, spec in queries.items():
+        query, params = spec[0], spec[1]
+        query_timeout = spec[2] if len(spec) > 2 else timeout
+        longest = max(longest, query_timeout)
+        handles[name] = _QueryHandle()
+        futures[name] = _executor.submit(_run_query, engine, query, params, query_timeout, handles[name])
+
+    done, not_done = wait(futures.values(), timeout=longest + CANCEL_GRACE, return_when=FIRST_EXCEPTION)
+    failed = next((f for f in done if f.exception() is not None), None)
+    if failed is not None or not_done:
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                handles[name].cancel()
+        if failed is not None:
+            raise failed.exception()
+        slow = ", ".join(name for name, f in futures.items() if f in not_done)
+        raise TimeoutError(f"Queries timed out: {slow}")
+
+    return {name: future.result() for name, future in futures.items()}
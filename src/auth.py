@@ -1,18 +1,66 @@
 # src/auth.py
-import hashlib
+import threading
+import time
 from datetime import datetime
 import random
 import string
+import streamlit as st
 from src.database import get_connection
+from src.password_hashing import hash_password_async, verify_password_async, DUMMY_HASH
+
+PROFILE_TTL_SECONDS = 600
+PROFILE_COLUMNS = ["user_id", "email", "username", "created_at"]
 
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hashes on the bounded KDF pool (see src/password_hashing.py)."""
+    return hash_password_async(password).result()
+
+def verify_password(password, stored):
+    return verify_password_async(password, stored).result()
 
 def generate_user_id():
     timestamp = int(datetime.now().timestamp())
     suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
     return f"USR{timestamp}{suffix}"
 
+# --- USER PROFILE CACHE ---
+# One profile per user, shared by every session and rerun in this server process.
+@st.cache_resource
+def _profile_store():
+    return {"lock": threading.Lock(), "profiles": {}}
+
+def _remember_profile(row):
+    profile = dict(zip(PROFILE_COLUMNS, row))
+    store = _profile_store()
+    with store["lock"]:
+        store["profiles"][profile["user_id"]] = (time.monotonic() + PROFILE_TTL_SECONDS, profile)
+    return profile
+
+def forget_user_profile(user_id):
+    store = _profile_store()
+    with store["lock"]:
+        store["profiles"].pop(user_id, None)
+
+def get_user_profile(user_id, refresh=False):
+    """Returns the cached profile, querying the database at most once per TTL.
+    Returns None if the user does not exist."""
+    store = _profile_store()
+    with store["lock"]:
+        cached = store["profiles"].get(user_id)
+    if cached and not refresh and cached[0] > time.monotonic():
+        return cached[1]
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(PROFILE_COLUMNS)} FROM users WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    if not row:
+        forget_user_profile(user_id)
+        return None
+    return _remember_profile(row)
+
 def create_user(email, password, username):
     conn = get_connection()
     cur = conn.cursor()
@@ -33,12 +81,27 @@ def create_user(email, password, username):
 def authenticate(email, password):
     conn = get_connection()
     cursor = conn.cursor()
-    hashed = hash_password(password)
-    cursor.execute("SELECT user_id, username FROM users WHERE email = %s AND password_hash = %s", (email, hashed))
+    cursor.execute(f"SELECT {', '.join(PROFILE_COLUMNS)}, password_hash FROM users WHERE email = %s", (email,))
     result = cursor.fetchone()
     cursor.close()
     conn.close()
-    return result if result else None
+    if not result:
+        verify_password(password, DUMMY_HASH)
+        return None
+    matches, needs_rehash = verify_password(password, result[-1])
+    if not matches:
+        return None
+    if needs_rehash:
+        # Transparently upgrade legacy sha256 (or outdated-cost) hashes on a successful login
+        new_hash = hash_password(password)
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET password_hash = %s WHERE user_id = %s AND password_hash = %s", (new_hash, result[0], result[-1]))
+        conn.commit()
+        cursor.close()
+        conn.close()
+    profile = _remember_profile(result[:-1])
+    return profile["user_id"], profile["username"]
 
 def reset_password(user_id, email, new_password):
     conn = get_connection()
@@ -46,10 +109,12 @@ def reset_password(user_id, email, new_password):
     cursor.execute("SELECT 1 FROM users WHERE user_id = %s AND email = %s", (user_id, email))
     if cursor.fetchone():
         hashed = hash_password(new_password)
-        cursor.execute("UPDATE users SET password_hash = %s WHERE user_id = %s", (hashed, user_id))
+        cursor.execute(f"UPDATE users SET password_hash = %s WHERE user_id = %s RETURNING {', '.join(PROFILE_COLUMNS)}", (hashed, user_id))
+        profile_row = cursor.fetchone()
         conn.commit()
         cursor.close()
         conn.close()
+        _remember_profile(profile_row)
         return True
     else:
         cursor.close()
@@ -59,7 +124,9 @@ def reset_password(user_id, email, new_password):
 def update_username(user_id, new_username):
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("UPDATE users SET username = %s WHERE user_id = %s", (new_username, user_id))
+    cursor.execute(f"UPDATE users SET username = %s WHERE user_id = %s RETURNING {', '.join(PROFILE_COLUMNS)}", (new_username, user_id))
+    profile_row = cursor.fetchone()
     conn.commit()
     cursor.close()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    return _remember_profile(profile_row) if profile_row else None
\ No newline at end of file
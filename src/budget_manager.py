@@ -0,0 +1,106 @@
+# src/budget_manager.py
+from collections import defaultdict
+from datetime import date
+from src.database import get_connection
+from src.utils import convert_to_currency
+
+def month_start(day):
+    """First day of the month that `day` falls in."""
+    return date(day.year, day.month, 1)
+
+def apply_budget_deltas(cursor, deltas):
+    """Folds expense deltas into the running month-to-date totals.
+
+    Runs on the caller's cursor so the totals commit (or roll back) together
+    with the expense write that produced them.
+    """
+    merged = defaultdict(float)
+    for d in deltas:
+        merged[(d.user_id, month_start(d.entry_date), d.category_label, d.currency)] += float(d.amount)
+
+    for (user_id, month, category_label, currency), amount in merged.items():
+        if amount == 0:
+            continue
+        cursor.execute("""
+            INSERT INTO budget_totals (user_id, month_start, category_label, currency, total)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, month_start, category_label, currency)
+            DO UPDATE SET total = budget_totals.total + EXCLUDED.total
+        """, (user_id, month, category_label, currency, amount))
+
+def rebuild_budget_totals(cursor, user_id=None):
+    """Recomputes the running totals from the expenses table (one-off backfill)."""
+    if user_id is None:
+        cursor.execute("DELETE FROM budget_totals")
+        user_filter, params = "", ()
+    else:
+        cursor.execute("DELETE FROM budget_totals WHERE user_id = %s", (user_id,))
+        user_filter, params = "WHERE user_id = %s", (user_id,)
+    cursor.execute(f"""
+        INSERT INTO budget_totals (user_id, month_start, category_label, currency, total)
+        SELECT user_id, date_trunc('month', entry_date)::date, category_label, currency, SUM(amount)
+        FROM expenses
+        {user_filter}
+        GROUP BY user_id, date_trunc('month', entry_date)::date, category_label, currency
+    """, params)
+
+def set_budget(user_id, category_label, monthly_limit, currency):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO budgets (user_id, category_label, monthly_limit, currency)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_id, category_label)
+            DO UPDATE SET monthly_limit = EXCLUDED.monthly_limit, currency = EXCLUDED.currency
+        """, (user_id, category_label, monthly_limit, currency))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def delete_budget(user_id, category_label):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM budgets WHERE user_id = %s AND category_label = %s", (user_id, category_label))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_budget_status(user_id, display_currency="USD", month=None):
+    """Returns each budgeted category with its month-to-date spend.
+
+    Reads only the budget rows and their matching running totals, so the cost
+    does not depend on how many expenses the user has.
+    """
+    month = month_start(month or date.today())
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT b.category_label, b.monthly_limit, b.currency, t.currency, t.total
+        FROM budgets b
+        LEFT JOIN budget_totals t
+          ON t.user_id = b.user_id AND t.category_label = b.category_label AND t.month_start = %s
+        WHERE b.user_id = %s
+        ORDER BY b.category_label
+    """, (month, user_id))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    status = {}
+    for category_label, limit, limit_currency, spent_currency, spent in rows:
+        entry = status.setdefault(category_label, {
+            "category_label": category_label,
+            "limit": convert_to_currency(float(limit), limit_currency, display_currency),
+            "spent": 0.0,
+        })
+        if spent is not None:
+            entry["spent"] += convert_to_currency(float(spent), spent_currency, display_currency)
+
+    for entry in status.values():
+        entry["percent"] = entry["spent"] / entry["limit"] * 100 if entry["limit"] else 0.0
+        entry["over_budget"] = entry["spent"] > entry["limit"]
+    return list(status.values())
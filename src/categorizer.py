@@ -0,0 +1,187 @@
+# src/categorizer.py
+"""Offline expense auto-categorization trained on each user's own history.
+
+Two layers, both local and cheap:
+  * an exact lookup of merchants the user has already categorized, and
+  * a multinomial naive Bayes over hashed features (merchant words, merchant
+    character trigrams, description words) for everything else.
+
+Models are cached per user in the server process (the MAX_MODELS most
+recently used) and updated incrementally as expenses are written: new rows
+are learned, and the old version of an edited or deleted row is unlearned.
+Scoring is batched: a whole frame of rows is featurized into one flat index
+array and summed with `np.add.reduceat`.
+"""
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+import numpy as np
+import streamlit as st
+from src.database import get_connection
+from src.utils import CATEGORIES_DATA
+
+N_FEATURES = 2 ** 14
+MAX_MODELS = 16  # each label costs ~200 KB, so a model is ~14 MB with every category in use
+_WORD = re.compile(r"[a-z0-9]+")
+_BIAS = zlib.crc32(b"__bias__") % N_FEATURES
+
+def _normalize(text):
+    return " ".join(_WORD.findall((text or "").lower()))
+
+def featurize(merchant, description):
+    """Hashed feature indices for one row (always at least the bias feature)."""
+    merchant, description = _normalize(merchant), _normalize(description)
+    tokens = [f"m:{w}" for w in merchant.split()]
+    padded = f" {merchant} "
+    tokens += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)] if merchant else []
+    tokens += [f"d:{w}" for w in description.split()]
+    return [_BIAS] + [zlib.crc32(t.encode()) % N_FEATURES for t in tokens]
+
+class ExpenseCategorizer:
+    def __init__(self):
+        self.labels = []  # (category_label, sub_category)
+        self._label_pos = {}
+        self.counts = np.zeros((0, N_FEATURES), dtype=np.float32)
+        self.class_counts = np.zeros(0, dtype=np.float64)
+        self.merchant_labels = defaultdict(Counter)
+        self._log_prob = None
+        self._lock = threading.Lock()
+
+    def _class(self, label):
+        if label not in self._label_pos:
+            self._label_pos[label] = len(self.labels)
+            self.labels.append(label)
+            self.counts = np.vstack([self.counts, np.zeros((1, N_FEATURES), dtype=np.float32)])
+            self.class_counts = np.append(self.class_counts, 0.0)
+        return self._label_pos[label]
+
+    def learn(self, merchants, descriptions, labels, weight=1):
+        """Adds labelled rows to the model (incremental; no full retrain)."""
+        with self._lock:
+            rows, cols = [], []
+            for merchant, description, label in zip(merchants, descriptions, labels):
+                if label[0] not in CATEGORIES_DATA:
+                    continue
+                k = self._class(label)
+                features = featurize(merchant, description)
+                rows.extend([k] * len(features))
+                cols.extend(features)
+                self.class_counts[k] = max(self.class_counts[k] + weight, 0.0)
+                merchant = _normalize(merchant)
+                if merchant:
+                    known = self.merchant_labels[merchant]
+                    known[label] += weight
+                    if known[label] <= 0:
+                        del known[label]
+                    if not known:
+                        del self.merchant_labels[merchant]
+            if rows:
+                np.add.at(self.counts, (np.array(rows), np.array(cols)), weight)
+                if weight < 0:
+                    # a row learned before the model was loaded may be unlearned twice
+                    np.maximum(self.counts, 0, out=self.counts)
+                self._log_prob = None
+
+    def unlearn(self, merchants, descriptions, labels):
+        """Removes rows learned earlier (the old version of an edited or deleted expense)."""
+        self.learn(merchants, descriptions, labels, weight=-1)
+
+    def _model(self):
+        if self._log_prob is None:
+            smoothed = self.counts + 1.0
+            self._log_prob = np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+            with np.errstate(divide="ignore"):
+                # a fully unlearned label gets -inf and is never predicted
+                self._log_prior = np.log(self.class_counts / self.class_counts.sum())
+        return self._log_prob, self._log_prior
+
+    def predict(self, merchants, descriptions):
+        """Best `(category_label, sub_category)` per row, or None when the model is empty."""
+        with self._lock:
+            if not self.class_counts.any():
+                return [None] * len(merchants)
+            log_prob, log_prior = self._model()
+            features = [featurize(m, d) for m, d in zip(merchants, descriptions)]
+            offsets = np.cumsum([0] + [len(f) for f in features[:-1]])
+            flat = np.fromiter((i for f in features for i in f), dtype=np.int64)
+            scores = np.add.reduceat(log_prob[:, flat], offsets, axis=1) + log_prior[:, None]
+            best = scores.argmax(axis=0)
+            predictions = []
+            for merchant, k in zip(merchants, best):
+                known = self.merchant_labels.get(_normalize(merchant))
+                predictions.append(known.most_common(1)[0][0] if known else self.labels[k])
+            return predictions
+
+@st.cache_resource
+def _model_store():
+    return {"lock": threading.Lock(), "models": OrderedDict()}
+
+def _cached_model(store, user_id):
+    """The user's loaded model (marked as most recently used), or None; call under the store lock."""
+    model = store["models"].get(user_id)
+    if model is not None:
+        store["models"].move_to_end(user_id)
+    return model
+
+def get_categorizer(user_id):
+    """The user's model, trained from their history the first time it is needed."""
+    store = _model_store()
+    with store["lock"]:
+        model = _cached_model(store, user_id)
+    if model is None:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT merchant_name, item_description_raw, category_label, sub_category
+            FROM expenses WHERE user_id = %s
+        """, (user_id,))
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        model = ExpenseCategorizer()
+        model.learn([r[0] for r in rows], [r[1] for r in rows], [(r[2], r[3]) for r in rows])
+        with store["lock"]:
+            model = store["models"].setdefault(user_id, model)
+            store["models"].move_to_end(user_id)
+            while len(store["models"]) > MAX_MODELS:
+                store["models"].popitem(last=False)
+    return model
+
+def learn_expenses(user_id, merchants, descriptions, labels):
+    """Feeds newly written expenses to the user's model if it is already loaded."""
+    store = _model_store()
+    with store["lock"]:
+        model = _cached_model(store, user_id)
+    if model is not None:
+        model.learn(merchants, descriptions, labels)
+
+def unlearn_expenses(user_id, merchants, descriptions, labels):
+    """Takes the old version of edited or deleted expenses out of the user's model if it is loaded."""
+    store = _model_store()
+    with store["lock"]:
+        model = _cached_model(store, user_id)
+    if model is not None:
+        model.unlearn(merchants, descriptions, labels)
+
+def suggest_category(user_id, merchant, description=""):
+    if not _normalize(merchant) and not _normalize(description):
+        return None
+    return get_categorizer(user_id).predict([merchant], [description])[0]
+
+def categorize_frame(user_id, df):
+    """Fills blank `category_label`/`sub_category` cells of an import frame in one batch."""
+    df = df.copy()
+    for column in ["category_label", "sub_category"]:
+        if column not in df:
+            df[column] = None
+    missing = df["category_label"].isna() | (df["category_label"].astype(str).str.strip() == "")
+    if missing.any():
+        predictions = get_categorizer(user_id).predict(
+            df.loc[missing, "merchant_name"].tolist(),
+            df.loc[missing, "item_description_raw"].tolist() if "item_description_raw" in df else [""] * missing.sum(),
+        )
+        fallback = ("Miscellaneous", "Other")
+        df.loc[missing, "category_label"] = [(p or fallback)[0] for p in predictions]
+        df.loc[missing, "sub_category"] = [(p or fallback)[1] for p in predictions]
+    return df
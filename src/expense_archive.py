@@ -0,0 +1,157 @@
+# src/expense_archive.py
+"""Cold tier for old expense partitions.
+
+Closed monthly partitions can be exported to compressed Parquet files (one
+file per month) and dropped from PostgreSQL. A month is first written to a
+staging file and only published once the partition drop has committed, so
+it is never visible in both tiers at once. `read_archived_expenses` only
+opens the files whose month overlaps the requested range, so recent-range
+queries never touch the archive. Archived rows are read-only.
+
+Next to each month sits a small manifest (`<month>.manifest.parquet`) of
+per-user daily sums by currency and category. The range index and the date
+bounds read only the manifests, so they never scan the full archived rows.
+
+Writing or reading archives needs a Parquet engine (`pyarrow`).
+"""
+import glob
+import os
+import re
+from datetime import date
+import pandas as pd
+
+ARCHIVE_DIR = os.environ.get("EXPENSE_ARCHIVE_DIR", os.path.join("archive", "expenses"))
+_FILE_PATTERN = re.compile(r"expenses_y(\d{4})m(\d{2})\.parquet$")
+
+def partition_name(month):
+    return f"expenses_y{month.year:04d}m{month.month:02d}"
+
+def archive_path(month, archive_dir=None):
+    return os.path.join(archive_dir or ARCHIVE_DIR, f"{partition_name(month)}.parquet")
+
+def manifest_path(month, archive_dir=None):
+    return os.path.join(archive_dir or ARCHIVE_DIR, f"{partition_name(month)}.manifest.parquet")
+
+def archived_months(archive_dir=None):
+    months = {}
+    for path in glob.glob(os.path.join(archive_dir or ARCHIVE_DIR, "expenses_y*m*.parquet")):
+        match = _FILE_PATTERN.search(path)
+        if match:
+            months[date(int(match.group(1)), int(match.group(2)), 1)] = path
+    return dict(sorted(months.items()))
+
+def _staged_path(month, archive_dir=None):
+    return f"{archive_path(month, archive_dir)}.tmp"
+
+def _daily_summary(df):
+    """Per-user daily sums and row counts by currency and category."""
+    df = df.assign(amount=pd.to_numeric(df["amount"]).astype(float))
+    return df.groupby(["user_id", "entry_date", "currency", "category_label"], as_index=False).agg(
+        amount=("amount", "sum"), count=("amount", "size"))
+
+def stage_archive(df, month, archive_dir=None):
+    """Writes one month of expense rows, and its manifest, to staging files (zstd-compressed) that readers ignore."""
+    path = _staged_path(month, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(path, index=False, compression="zstd")
+    _daily_summary(df).to_parquet(f"{manifest_path(month, archive_dir)}.tmp", index=False, compression="zstd")
+    return path
+
+def staged_months(archive_dir=None):
+    months = []
+    for path in glob.glob(os.path.join(archive_dir or ARCHIVE_DIR, "expenses_y*m*.parquet.tmp")):
+        match = _FILE_PATTERN.search(path[:-len(".tmp")])
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+def publish_archive(month, archive_dir=None):
+    """Moves a staged month into place, making it visible to readers.
+
+    The manifest goes first: readers find months by their data file, so a
+    published month always has its manifest.
+    """
+    staged_manifest = f"{manifest_path(month, archive_dir)}.tmp"
+    if os.path.exists(staged_manifest):
+        os.replace(staged_manifest, manifest_path(month, archive_dir))
+    os.replace(_staged_path(month, archive_dir), archive_path(month, archive_dir))
+
+def discard_staged_archive(month, archive_dir=None):
+    staged_manifest = f"{manifest_path(month, archive_dir)}.tmp"
+    if os.path.exists(staged_manifest):
+        os.remove(staged_manifest)
+    os.remove(_staged_path(month, archive_dir))
+
+def write_missing_manifests(archive_dir=None):
+    """Writes the manifest of every month archived before manifests existed; returns those months."""
+    written = []
+    for month, path in archived_months(archive_dir).items():
+        if not os.path.exists(manifest_path(month, archive_dir)):
+            columns = ["user_id", "entry_date", "currency", "category_label", "amount"]
+            staged = f"{manifest_path(month, archive_dir)}.tmp"
+            _daily_summary(pd.read_parquet(path, columns=columns)).to_parquet(staged, index=False, compression="zstd")
+            os.replace(staged, manifest_path(month, archive_dir))
+            written.append(month)
+    return written
+
+def _month_end(month):
+    return (pd.Timestamp(month) + pd.offsets.MonthEnd(0)).date()
+
+def _file_columns(path):
+    import pyarrow.parquet as pq
+    return set(pq.read_schema(path).names)
+
+def read_archived_expenses(user_id, start_date, end_date, columns=None, archive_dir=None):
+    """Archived rows for one user in `[start_date, end_date]`, or an empty frame.
+
+    Columns added to `expenses` after a month was archived come back empty.
+    """
+    frames = []
+    for month, path in archived_months(archive_dir).items():
+        if _month_end(month) < start_date or month > end_date:
+            continue
+        if columns is not None:
+            available = _file_columns(path)
+            wanted = [c for c in dict.fromkeys(["user_id", *columns]) if c in available]
+        else:
+            wanted = None
+        df = pd.read_parquet(path, columns=wanted, filters=[("user_id", "==", user_id)])
+        df = df[(df["entry_date"] >= start_date) & (df["entry_date"] <= end_date)]
+        frames.append(df if columns is None else df.reindex(columns=columns))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+def _user_manifests(user_id, archive_dir=None):
+    """One user's manifest rows across every archived month."""
+    frames = []
+    for month, path in archived_months(archive_dir).items():
+        manifest = manifest_path(month, archive_dir)
+        if os.path.exists(manifest):
+            frames.append(pd.read_parquet(manifest, filters=[("user_id", "==", user_id)]))
+        else:
+            # archived before manifests existed (`write_missing_manifests` adds them)
+            rows = read_archived_expenses(user_id, month, _month_end(month),
+                                          ["user_id", "entry_date", "currency", "category_label", "amount"], archive_dir)
+            if not rows.empty:
+                frames.append(_daily_summary(rows))
+    if not frames:
+        return pd.DataFrame(columns=["user_id", "entry_date", "currency", "category_label", "amount", "count"])
+    return pd.concat(frames, ignore_index=True)
+
+def archived_daily_totals(user_id, archive_dir=None):
+    """`(entry_date, currency, category_label, amount)` daily sums from the archive manifests."""
+    df = _user_manifests(user_id, archive_dir)
+    if df.empty:
+        return []
+    return list(df[["entry_date", "currency", "category_label", "amount"]].itertuples(index=False, name=None))
+
+def archive_overlaps(start_date, end_date, archive_dir=None):
+    return any(month <= end_date and _month_end(month) >= start_date for month in archived_months(archive_dir))
+
+def archived_date_bounds(user_id, archive_dir=None):
+    """`(first, last)` archived entry_date for one user, or `(None, None)`."""
+    df = _user_manifests(user_id, archive_dir)
+    if df.empty:
+        return None, None
+    return df["entry_date"].min(), df["entry_date"].max()
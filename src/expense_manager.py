@@ -2,61 +2,251 @@
 import streamlit as st
 import pandas as pd
 import uuid
+from collections import Counter, defaultdict, namedtuple
 from datetime import date
 from src.database import get_connection, get_db_engine
+from src.budget_manager import apply_budget_deltas
+from src.monthly_reports import invalidate_reports
+from src.async_data import fetch_concurrently
+from src.mutation_queue import MutationQueue
+from src.range_index import patch_range_indexes, hold_range_indexes, bump_data_versions
+from src.expense_archive import read_archived_expenses, archive_overlaps, archived_date_bounds
+from src.anomaly_detector import observe_expense, rescore_expense, forget_anomaly, get_expense_anomalies
+from src.categorizer import learn_expenses, unlearn_expenses
+from src.ledger_manager import lock_membership, apply_ledger_deltas, get_ledger_dashboard, get_ledger_date_bounds
+from src.utils import KHR_TO_USD, convert_to_currency
 
-def add_expense(user_id, entry_date, amount, currency, merchant_name, category, sub_category, payment_method, description):
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        item_id = uuid.uuid4()
-        cursor.execute("""
-            INSERT INTO expenses (item_id, user_id, entry_date, amount, currency, merchant_name, transaction_type, category_label, sub_category, payment_method, item_description_raw)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (item_id, user_id, entry_date, amount, currency, merchant_name, "Expense", category, sub_category, payment_method, description))
-        conn.commit()
-        st.success("✅ Expense added successfully!")
-        get_expenses_as_df.clear() # Clear cache
-    except Exception as e:
-        st.error(f"❌ Failed to save expense: {e}")
-    finally:
-        if 'conn' in locals() and conn:
-            cursor.close()
-            conn.close()
+_NOT_FOUND = "Expense not found. It may have been deleted elsewhere, or it is in an archived (read-only) month."
+
+# A signed change to a user's spend, produced by every expense write.
+# `count` is +1 for an added row and -1 for a removed one; `ledger_id` is the shared ledger, if any.
+ExpenseDelta = namedtuple("ExpenseDelta", ["user_id", "entry_date", "category_label", "currency", "amount", "ledger_id", "count"])
+
+# A row the user's categorizer should learn (`weight` +1) or unlearn (-1) once the write commits.
+LabelledRow = namedtuple("LabelledRow", ["user_id", "merchant_name", "description", "label", "weight"])
+
+def _insert_expense(cursor, item_id, user_id, entry_date, amount, currency, merchant_name, category, sub_category, payment_method, description, ledger_id=None):
+    if ledger_id is not None:
+        lock_membership(cursor, ledger_id, user_id)
+    cursor.execute("""
+        INSERT INTO expenses (item_id, user_id, entry_date, amount, currency, merchant_name, transaction_type, category_label, sub_category, payment_method, item_description_raw, ledger_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (item_id, user_id, entry_date, amount, currency, merchant_name, "Expense", category, sub_category, payment_method, description, ledger_id))
+    observe_expense(cursor, item_id, user_id, entry_date, category, merchant_name, amount, currency)
+    return ([ExpenseDelta(user_id, entry_date, category, currency, amount, ledger_id, 1)],
+            [LabelledRow(user_id, merchant_name, description, (category, sub_category), 1)])
+
+def _update_expense(cursor, item_id, user_id, entry_date, amount, currency, merchant_name, category_label, sub_category, payment_method, item_description_raw, ledger_id=None):
+    if ledger_id is not None:
+        lock_membership(cursor, ledger_id, user_id)
+    cursor.execute("""
+        SELECT entry_date, amount, currency, category_label, ledger_id, merchant_name, item_description_raw, sub_category
+        FROM expenses WHERE item_id = %s AND user_id = %s
+        FOR UPDATE
+    """, (item_id, user_id))
+    old = cursor.fetchone()
+    if not old:
+        raise LookupError(_NOT_FOUND)
+    cursor.execute("""
+        UPDATE expenses
+        SET entry_date = %s, amount = %s, currency = %s, merchant_name = %s,
+            category_label = %s, sub_category = %s, payment_method = %s,
+            item_description_raw = %s, ledger_id = %s
+        WHERE item_id = %s AND user_id = %s
+    """, (entry_date, amount, currency, merchant_name, category_label, sub_category, payment_method, item_description_raw, ledger_id, item_id, user_id))
+    rescore_expense(cursor, item_id, user_id, entry_date, category_label, merchant_name, amount, currency)
+    old_date, old_amount, old_currency, old_category, old_ledger, old_merchant, old_description, old_sub_category = old
+    return (
+        [
+            ExpenseDelta(user_id, old_date, old_category, old_currency, -old_amount, old_ledger, -1),
+            ExpenseDelta(user_id, entry_date, category_label, currency, amount, ledger_id, 1),
+        ],
+        [
+            LabelledRow(user_id, old_merchant, old_description, (old_category, old_sub_category), -1),
+            LabelledRow(user_id, merchant_name, item_description_raw, (category_label, sub_category), 1),
+        ],
+    )
+
+def _delete_expense(cursor, item_id, user_id):
+    cursor.execute("""
+        DELETE FROM expenses WHERE item_id = %s AND user_id = %s
+        RETURNING entry_date, amount, currency, category_label, ledger_id, merchant_name, item_description_raw, sub_category
+    """, (item_id, user_id))
+    old = cursor.fetchone()
+    if not old:
+        raise LookupError(_NOT_FOUND)
+    forget_anomaly(cursor, item_id)
+    old_date, old_amount, old_currency, old_category, old_ledger, old_merchant, old_description, old_sub_category = old
+    return ([ExpenseDelta(user_id, old_date, old_category, old_currency, -old_amount, old_ledger, -1)],
+            [LabelledRow(user_id, old_merchant, old_description, (old_category, old_sub_category), -1)])
+
+def _apply_deltas(cursor, deltas):
+    """Keeps the derived tables in step with an expense write, inside the same transaction.
+
+    Returns the new data version of each user the write touched.
+    """
+    apply_budget_deltas(cursor, deltas)
+    apply_ledger_deltas(cursor, deltas)
+    invalidate_reports(cursor, deltas)
+    return bump_data_versions(cursor, {d.user_id for d in deltas})
+
+def _clear_caches():
+    get_expenses_as_df.clear()
+    get_dashboard_data.clear()
+    get_expense_date_bounds.clear()
+    get_expense_anomalies.clear()
+    get_ledger_date_bounds.clear()
+    get_ledger_dashboard.clear()
+
+_WRITERS = {"add": _insert_expense, "update": _update_expense, "delete": _delete_expense}
 
-def update_expense(item_id, user_id, entry_date, amount, currency, merchant_name, category_label, sub_category, payment_method, item_description_raw):
+def _write_batch(mutations):
+    """Applies a batch of queued mutations in one transaction.
+
+    Each mutation runs under its own savepoint so one bad row only fails its
+    own future; the derived-table deltas for the whole batch are applied once.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE expenses
-            SET entry_date = %s, amount = %s, currency = %s, merchant_name = %s,
-                category_label = %s, sub_category = %s, payment_method = %s,
-                item_description_raw = %s
-            WHERE item_id = %s AND user_id = %s
-        """, (entry_date, amount, currency, merchant_name, category_label, sub_category, payment_method, item_description_raw, item_id, user_id))
-        conn.commit()
-        st.success("✅ Expense updated successfully!")
-        get_expenses_as_df.clear()
-    except Exception as e:
-        st.error(f"❌ Failed to update expense: {e}")
+        applied, deltas, labelled = [], [], []
+        for m in mutations:
+            cursor.execute("SAVEPOINT mutation")
+            try:
+                written, relabelled = _WRITERS[m.kind](cursor, *m.args)
+                deltas.extend(written)
+                labelled.extend(relabelled)
+                cursor.execute("RELEASE SAVEPOINT mutation")
+                applied.append(m)
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT mutation")
+                m.future.set_exception(e)
+        # Held from the version bump to the patch, so no index is built in between
+        with hold_range_indexes({d.user_id for d in deltas}):
+            versions = _apply_deltas(cursor, deltas)
+            conn.commit()
+            for m in applied:
+                # the committed data version; pages keep overlaying the write until they read a frame this new
+                m.future.set_result(versions[m.args[1]])
+            # a half-patched index keeps its old version, so it is rebuilt on its next check
+            _after_commit("patching range indexes", patch_range_indexes, deltas, versions)
     finally:
         cursor.close()
         conn.close()
+    _after_commit("updating categorizers", _learn_labelled, labelled)
+    _after_commit("clearing caches", _clear_caches)
 
-def delete_expense(item_id, user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
+def _after_commit(step, func, *args):
+    """Runs a best-effort step after a batch committed; it must not fail the committed writes."""
     try:
-        cursor.execute("DELETE FROM expenses WHERE item_id = %s AND user_id = %s", (item_id, user_id))
-        conn.commit()
-        st.success("🗑️ Expense deleted successfully!")
-        get_expenses_as_df.clear()
+        func(*args)
     except Exception as e:
-        st.error(f"❌ Failed to delete expense: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+        print(f"Expense batch committed, but {step} failed: {e}")
+
+def _learn_labelled(labelled):
+    for row in labelled:
+        # an update unlearns the old row before learning the new one
+        learner = learn_expenses if row.weight > 0 else unlearn_expenses
+        learner(row.user_id, [row.merchant_name], [row.description], [row.label])
+
+@st.cache_resource
+def get_mutation_queue():
+    return MutationQueue(_write_batch)
+
+def _submit_mutation(kind, args, row):
+    """Queues a write and records it for the optimistic view until it is confirmed."""
+    future = get_mutation_queue().submit(kind, args[1], args)
+    st.session_state.setdefault("pending_mutations", []).append({"kind": kind, "row": row, "future": future})
+    return future
+
+def add_expense(user_id, entry_date, amount, currency, merchant_name, category, sub_category, payment_method, description, ledger_id=None):
+    item_id = str(uuid.uuid4())
+    row = {"item_id": item_id, "entry_date": entry_date, "amount": amount, "currency": currency,
+           "merchant_name": merchant_name, "category_label": category, "sub_category": sub_category,
+           "payment_method": payment_method, "item_description_raw": description, "ledger_id": ledger_id}
+    return _submit_mutation("add", (item_id, user_id, entry_date, amount, currency, merchant_name, category, sub_category, payment_method, description, ledger_id), row)
+
+def update_expense(item_id, user_id, entry_date, amount, currency, merchant_name, category_label, sub_category, payment_method, item_description_raw, ledger_id=None):
+    row = {"item_id": item_id, "entry_date": entry_date, "amount": amount, "currency": currency,
+           "merchant_name": merchant_name, "category_label": category_label, "sub_category": sub_category,
+           "payment_method": payment_method, "item_description_raw": item_description_raw, "ledger_id": ledger_id}
+    return _submit_mutation("update", (item_id, user_id, entry_date, amount, currency, merchant_name, category_label, sub_category, payment_method, item_description_raw, ledger_id), row)
+
+def delete_expense(item_id, user_id):
+    return _submit_mutation("delete", (item_id, user_id), {"item_id": item_id})
+
+_MUTATION_MESSAGES = {
+    # kind: (one succeeded, n succeeded, one failed, n failed)
+    "add": ("✅ Expense added successfully!", "✅ {n} expenses added", "❌ Failed to save expense", "❌ Failed to save {n} expenses"),
+    "update": ("✅ Expense updated successfully!", "✅ {n} expenses updated", "❌ Failed to update expense", "❌ Failed to update {n} expenses"),
+    "delete": ("🗑️ Expense deleted successfully!", "🗑️ {n} expenses deleted", "❌ Failed to delete expense", "❌ Failed to delete {n} expenses"),
+}
+
+def report_finished_mutations():
+    """Shows the outcome of queued writes that have completed since the last rerun, one message per kind."""
+    pending = st.session_state.get("pending_mutations", [])
+    kept = []
+    succeeded, failed = Counter(), defaultdict(list)
+    for p in pending:
+        if not p["future"].done() or p.get("reported"):
+            kept.append(p)
+            continue
+        error = p["future"].exception()
+        if error is None:
+            succeeded[p["kind"]] += 1
+            # kept for the overlay until a frame fetched after the commit is read
+            p["reported"] = True
+            kept.append(p)
+        else:
+            failed[p["kind"]].append(str(error))
+    st.session_state.pending_mutations = kept
+
+    for kind, n in succeeded.items():
+        one, many, _, _ = _MUTATION_MESSAGES[kind]
+        st.toast(one if n == 1 else many.format(n=n))
+    for kind, errors in failed.items():
+        _, _, one, many = _MUTATION_MESSAGES[kind]
+        reasons = "; ".join(dict.fromkeys(errors))
+        st.error(f"{one if len(errors) == 1 else many.format(n=len(errors))}: {reasons}")
+
+def _still_overlaid(p, version):
+    if not p["future"].done():
+        return True
+    return p["future"].exception() is None and (version is None or p["future"].result() > version)
+
+def apply_pending_mutations(df, start_date, end_date, version=None):
+    """Overlays writes onto a cached expenses frame fetched at data `version`.
+
+    A write stays overlaid while it is queued, and after it commits until
+    the frame's version includes it, so a snapshot read just before the
+    commit cannot hide it.
+    """
+    all_pending = st.session_state.get("pending_mutations", [])
+    pending = [p for p in all_pending if _still_overlaid(p, version)]
+    overlaid = {id(p) for p in pending}
+    st.session_state.pending_mutations = [p for p in all_pending if id(p) in overlaid or not p.get("reported")]
+    if not pending:
+        return df
+    ids = df["item_id"].astype(str)
+    existing = set(ids)
+    replaced, new_rows = set(), {}
+    for p in pending:
+        item_id = str(p["row"]["item_id"])
+        if p["kind"] == "add" and item_id in existing:
+            continue
+        if p["kind"] != "add":
+            replaced.add(item_id)
+        new_rows.pop(item_id, None)
+        if p["kind"] != "delete" and start_date <= p["row"]["entry_date"] <= end_date:
+            new_rows[item_id] = p["row"]
+    df = df[~ids.isin(replaced)]
+    if new_rows:
+        df = pd.concat([df, pd.DataFrame(list(new_rows.values()))], ignore_index=True)
+    return df.sort_values("entry_date", ascending=False, ignore_index=True)
+
+def flush_mutations(timeout=30):
+    """Blocks until every queued write is durable (used before a session ends)."""
+    get_mutation_queue().flush(timeout)
 
 def get_expense_by_id(item_id, user_id):
     conn = get_connection()
@@ -69,14 +259,105 @@ def get_expense_by_id(item_id, user_id):
     return dict(zip(colnames, expense_data)) if expense_data else None
 
 @st.cache_data
-def get_expenses_as_df(user_id, start_date, end_date):
+def get_expenses_as_df(user_id, start_date, end_date, version=None):
+    """Expenses in the range, hot and archived. `version` (the user's data version) only keys the cache."""
     engine = get_db_engine()
     query = """
         SELECT item_id, entry_date, amount, currency, merchant_name,
-               category_label, sub_category, payment_method, item_description_raw
+               category_label, sub_category, payment_method, item_description_raw, ledger_id
         FROM expenses
         WHERE user_id = %(user_id)s AND entry_date BETWEEN %(start_date)s AND %(end_date)s
         ORDER BY entry_date DESC
     """
     params = {"user_id": user_id, "start_date": start_date, "end_date": end_date}
-    return pd.read_sql_query(query, engine, params=params)
\ No newline at end of file
+    df = pd.read_sql_query(query, engine, params=params)
+    # Months moved to the cold tier are read from their Parquet files; they are read-only
+    archived = read_archived_expenses(user_id, start_date, end_date, list(df.columns))
+    df["archived"] = False
+    if archived.empty:
+        return df
+    archived["archived"] = True
+    return pd.concat([df, archived], ignore_index=True).sort_values("entry_date", ascending=False, ignore_index=True)
+
+# --- AGGREGATE QUERIES ---
+# Amounts are converted to the display currency in SQL so only totals cross the wire.
+_CONVERTED_AMOUNT = """
+    (amount * CASE WHEN currency = %(display_currency)s THEN 1
+                   WHEN %(display_currency)s = 'USD' THEN 1.0 / %(rate)s
+                   ELSE %(rate)s END)::float
+"""
+_RANGE_FILTER = "user_id = %(user_id)s AND entry_date BETWEEN %(start_date)s AND %(end_date)s"
+
+def _aggregate_params(user_id, start_date, end_date, display_currency):
+    return {"user_id": user_id, "start_date": start_date, "end_date": end_date,
+            "display_currency": display_currency, "rate": KHR_TO_USD}
+
+def summary_query(user_id, start_date, end_date, display_currency):
+    return f"""
+        SELECT COALESCE(SUM({_CONVERTED_AMOUNT}), 0) AS total,
+               COUNT(*) AS transactions,
+               COUNT(DISTINCT entry_date) AS active_days
+        FROM expenses WHERE {_RANGE_FILTER}
+    """, _aggregate_params(user_id, start_date, end_date, display_currency)
+
+def daily_totals_query(user_id, start_date, end_date, display_currency):
+    return f"""
+        SELECT entry_date, SUM({_CONVERTED_AMOUNT}) AS converted_amount
+        FROM expenses WHERE {_RANGE_FILTER}
+        GROUP BY entry_date ORDER BY entry_date
+    """, _aggregate_params(user_id, start_date, end_date, display_currency)
+
+def merchant_totals_query(user_id, start_date, end_date, display_currency, limit=5):
+    params = _aggregate_params(user_id, start_date, end_date, display_currency)
+    params["limit"] = limit  # None -> LIMIT NULL, i.e. every merchant
+    return f"""
+        SELECT COALESCE(NULLIF(TRIM(merchant_name), ''), 'Other') AS merchant_name,
+               SUM({_CONVERTED_AMOUNT}) AS converted_amount
+        FROM expenses WHERE {_RANGE_FILTER}
+        GROUP BY 1 ORDER BY converted_amount DESC LIMIT %(limit)s
+    """, params
+
+@st.cache_data
+def get_expense_date_bounds(user_id):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(entry_date), MAX(entry_date) FROM expenses WHERE user_id = %s", (user_id,))
+    bounds = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    archived = archived_date_bounds(user_id)
+    firsts = [d for d in (bounds[0], archived[0]) if d is not None]
+    lasts = [d for d in (bounds[1], archived[1]) if d is not None]
+    return (min(firsts) if firsts else None, max(lasts) if lasts else None)
+
+def _add_archived_aggregates(data, user_id, start_date, end_date, display_currency, limit=5):
+    """Folds rows from archived months into the SQL aggregates of `get_dashboard_data`."""
+    archived = read_archived_expenses(user_id, start_date, end_date, ["entry_date", "amount", "currency", "merchant_name"])
+    if archived.empty:
+        return {**data, "merchants": data["merchants"].head(limit)}
+    rates = {c: convert_to_currency(1.0, c, display_currency) for c in archived["currency"].unique()}
+    archived["converted_amount"] = archived["amount"].astype(float) * archived["currency"].map(rates)
+    archived["merchant_name"] = archived["merchant_name"].fillna("").str.strip().replace("", "Other")
+    daily = (pd.concat([data["daily"], archived[["entry_date", "converted_amount"]]])
+             .groupby("entry_date", as_index=False)["converted_amount"].sum())
+    merchants = (pd.concat([data["merchants"], archived[["merchant_name", "converted_amount"]]])
+                 .groupby("merchant_name", as_index=False)["converted_amount"].sum()
+                 .nlargest(limit, "converted_amount"))
+    summary = pd.DataFrame([{
+        "total": daily["converted_amount"].sum(),
+        "transactions": int(data["summary"]["transactions"].iloc[0]) + len(archived),
+        "active_days": len(daily),
+    }])
+    return {**data, "summary": summary, "daily": daily, "merchants": merchants}
+
+@st.cache_data
+def get_dashboard_data(user_id, start_date, end_date, display_currency):
+    """Fetches the dashboard's independent aggregates concurrently, adding archived months."""
+    archived = archive_overlaps(start_date, end_date)
+    data = fetch_concurrently({
+        "summary": summary_query(user_id, start_date, end_date, display_currency),
+        "daily": daily_totals_query(user_id, start_date, end_date, display_currency),
+        # the top 5 can only be picked once archived spend is added in
+        "merchants": merchant_totals_query(user_id, start_date, end_date, display_currency, limit=None if archived else 5),
+    })
+    return _add_archived_aggregates(data, user_id, start_date, end_date, display_currency) if archived else data
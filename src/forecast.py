@@ -0,0 +1,85 @@
+# src/forecast.py
+"""Month-end and next-month spending forecasts per category.
+
+Each category's daily series (read from the prefix-sum range index) is
+fitted with simple exponential smoothing. All categories, plus the overall
+total, are fitted together in one vectorized pass: the series form the
+columns of a single frame. The smoothed level is the expected daily spend.
+One-step-ahead errors give the uncertainty band. Fits are cached by the
+index's data version, so they are recomputed only after the user's data
+changes (or the day rolls over).
+"""
+import calendar
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import streamlit as st
+from src.range_index import get_range_index, data_version
+
+HISTORY_DAYS = 90
+ALPHA = 0.15
+BAND_Z = 1.64  # ~90% interval
+
+def fit_levels(series, alpha=ALPHA):
+    """Fits every row of a (series, days) array at once; returns (levels, one-step error std)."""
+    frame = pd.DataFrame(series.T)
+    levels = frame.ewm(alpha=alpha, adjust=False).mean()
+    errors = frame.iloc[1:].to_numpy() - levels.iloc[:-1].to_numpy()
+    sigma = errors.std(axis=0) if len(errors) > 1 else np.zeros(series.shape[0])
+    return levels.iloc[-1].to_numpy(), sigma
+
+def _band(mean, sigma, horizon):
+    spread = BAND_Z * sigma * np.sqrt(max(horizon, 0))
+    return float(max(mean - spread, 0.0)), float(mean + spread)
+
+@st.cache_data
+def _forecast(user_id, version, today, display_currency):
+    index = get_range_index(user_id)
+    history_end = today - timedelta(days=1)
+    categories, daily = index.daily_matrix(history_end - timedelta(days=HISTORY_DAYS - 1), history_end, display_currency)
+    series = np.vstack([daily, daily.sum(axis=0, keepdims=True)])
+    levels, sigmas = fit_levels(series)
+    levels = np.clip(levels, 0, None)
+    category_levels, total_level, total_sigma = levels[:-1], levels[-1], sigmas[-1]
+
+    month_start = today.replace(day=1)
+    month_days = calendar.monthrange(today.year, today.month)[1]
+    remaining = month_days - today.day
+    next_month = month_start + timedelta(days=month_days)
+    next_days = calendar.monthrange(next_month.year, next_month.month)[1]
+
+    month_to_date = index.category_totals(month_start, today, display_currency)
+    month_end_by_category = {
+        c: month_to_date.get(c, 0.0) + float(level) * remaining for c, level in zip(categories, category_levels)
+    }
+    for c, spent in month_to_date.items():
+        month_end_by_category.setdefault(c, spent)
+    to_date = sum(month_to_date.values())
+    month_end = to_date + float(total_level) * remaining
+    # only the remaining days are uncertain; what is already spent is the floor
+    low, high = _band(float(total_level) * remaining, total_sigma, remaining)
+    next_month_total = float(total_level) * next_days
+
+    future = [today + timedelta(days=d) for d in range(1, remaining + 1)]
+    daily_band = [_band(float(total_level), total_sigma, 1) for _ in future]
+    return {
+        "month_to_date": to_date,
+        "month_end": month_end,
+        "month_end_band": (to_date + low, to_date + high),
+        "month_end_by_category": {c: v for c, v in month_end_by_category.items() if round(v, 2)},
+        "next_month": next_month_total,
+        "next_month_band": _band(next_month_total, total_sigma, next_days),
+        "next_month_by_category": {
+            c: float(level) * next_days for c, level in zip(categories, category_levels) if round(level * next_days, 2)
+        },
+        "daily_forecast": pd.DataFrame({
+            "entry_date": future,
+            "expected": [float(total_level)] * len(future),
+            "lower": [b[0] for b in daily_band],
+            "upper": [b[1] for b in daily_band],
+        }),
+    }
+
+def get_spending_forecast(user_id, display_currency="USD"):
+    """Forecast for the current month and the next, reused until the user's data version changes."""
+    return _forecast(user_id, data_version(user_id), date.today(), display_currency)
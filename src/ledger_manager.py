@@ -0,0 +1,229 @@
+# src/ledger_manager.py
+"""Shared household ledgers.
+
+A ledger groups several users. A member tags an expense with the ledger when
+saving it, and every member then sees the expense in the group view.
+Group totals per (ledger, day, category, currency, member) live in
+`ledger_daily_totals`. They are maintained from the same expense deltas as
+the budget totals, inside the write transaction. The group dashboard reads
+only these summary rows, so it costs the same as a single-user dashboard no
+matter how many members or expenses the ledger has.
+
+Every group read checks membership in SQL.
+"""
+from collections import defaultdict
+import streamlit as st
+from src.database import get_connection
+from src.async_data import fetch_concurrently
+from src.utils import KHR_TO_USD
+
+def lock_membership(cursor, ledger_id, user_id):
+    """Checks that `user_id` belongs to the ledger for the rest of the caller's transaction.
+
+    The membership row is share-locked, so a concurrent removal waits until
+    the expense write has committed and then untags it along with the rest.
+    """
+    cursor.execute("""
+        SELECT 1 FROM ledger_members WHERE ledger_id = %s AND user_id = %s
+        FOR SHARE
+    """, (ledger_id, user_id))
+    if cursor.fetchone() is None:
+        raise PermissionError("You are not a member of this ledger.")
+
+def apply_ledger_deltas(cursor, deltas):
+    """Folds the deltas of ledger-tagged expenses into the group totals (caller's transaction)."""
+    merged = defaultdict(lambda: [0.0, 0])
+    for d in deltas:
+        if d.ledger_id is None:
+            continue
+        entry = merged[(d.ledger_id, d.entry_date, d.category_label, d.currency, d.user_id)]
+        entry[0] += float(d.amount)
+        entry[1] += d.count
+
+    for (ledger_id, entry_date, category_label, currency, user_id), (amount, count) in merged.items():
+        if amount == 0 and count == 0:
+            continue
+        cursor.execute("""
+            INSERT INTO ledger_daily_totals (ledger_id, entry_date, category_label, currency, user_id, total, txn_count)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (ledger_id, entry_date, category_label, currency, user_id)
+            DO UPDATE SET total = ledger_daily_totals.total + EXCLUDED.total,
+                          txn_count = ledger_daily_totals.txn_count + EXCLUDED.txn_count
+        """, (ledger_id, entry_date, category_label, currency, user_id, amount, count))
+
+def rebuild_ledger_totals(cursor, ledger_id=None):
+    """Recomputes the group totals from the expenses table (backfill or repair)."""
+    if ledger_id is None:
+        cursor.execute("DELETE FROM ledger_daily_totals")
+        ledger_filter, params = "ledger_id IS NOT NULL", ()
+    else:
+        cursor.execute("DELETE FROM ledger_daily_totals WHERE ledger_id = %s", (ledger_id,))
+        ledger_filter, params = "ledger_id = %s", (ledger_id,)
+    cursor.execute(f"""
+        INSERT INTO ledger_daily_totals (ledger_id, entry_date, category_label, currency, user_id, total, txn_count)
+        SELECT ledger_id, entry_date, category_label, currency, user_id, SUM(amount), COUNT(*)
+        FROM expenses
+        WHERE {ledger_filter}
+        GROUP BY ledger_id, entry_date, category_label, currency, user_id
+    """, params)
+
+def _clear_ledger_caches():
+    get_user_ledgers.clear()
+    get_ledger_members.clear()
+    get_ledger_date_bounds.clear()
+    get_ledger_dashboard.clear()
+
+# --- MEMBERSHIP MANAGEMENT ---
+def create_ledger(user_id, name):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("INSERT INTO ledgers (name, owner_id) VALUES (%s, %s) RETURNING ledger_id", (name, user_id))
+        ledger_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO ledger_members (ledger_id, user_id, role) VALUES (%s, %s, 'owner')
+        """, (ledger_id, user_id))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    _clear_ledger_caches()
+    return ledger_id
+
+def add_ledger_member(ledger_id, owner_id, email):
+    """Adds the account registered under `email`; only the ledger's owner may add members."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO ledger_members (ledger_id, user_id, role)
+            SELECT l.ledger_id, u.user_id, 'member'
+            FROM ledgers l, users u
+            WHERE l.ledger_id = %s AND l.owner_id = %s AND u.email = %s
+            ON CONFLICT (ledger_id, user_id) DO NOTHING
+            RETURNING user_id
+        """, (ledger_id, owner_id, email))
+        added = cursor.fetchone() is not None
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    _clear_ledger_caches()
+    return added
+
+def leave_ledger(ledger_id, user_id):
+    """Removes a member, untagging their expenses. When the owner leaves, the ledger is deleted."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM ledger_members WHERE ledger_id = %s AND user_id = %s
+            RETURNING role
+        """, (ledger_id, user_id))
+        row = cursor.fetchone()
+        if row and row[0] == "owner":
+            cursor.execute("UPDATE expenses SET ledger_id = NULL WHERE ledger_id = %s", (ledger_id,))
+            # members and totals cascade
+            cursor.execute("DELETE FROM ledgers WHERE ledger_id = %s", (ledger_id,))
+        elif row:
+            cursor.execute("UPDATE expenses SET ledger_id = NULL WHERE ledger_id = %s AND user_id = %s", (ledger_id, user_id))
+            # totals are kept per member, so the member's share drops out without a rebuild
+            cursor.execute("DELETE FROM ledger_daily_totals WHERE ledger_id = %s AND user_id = %s", (ledger_id, user_id))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    _clear_ledger_caches()
+    return row is not None
+
+@st.cache_data
+def get_user_ledgers(user_id):
+    """`[{"ledger_id", "name", "role"}]` for every ledger the user belongs to."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT l.ledger_id, l.name, m.role
+        FROM ledger_members m
+        JOIN ledgers l ON l.ledger_id = m.ledger_id
+        WHERE m.user_id = %s
+        ORDER BY l.name
+    """, (user_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return [{"ledger_id": ledger_id, "name": name, "role": role} for ledger_id, name, role in rows]
+
+@st.cache_data
+def get_ledger_members(ledger_id, user_id):
+    """`(username, email, role)` of each member, or [] when `user_id` is not a member."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT u.username, u.email, m.role
+        FROM ledger_members m
+        JOIN users u ON u.user_id = m.user_id
+        WHERE m.ledger_id = %s
+          AND EXISTS (SELECT 1 FROM ledger_members WHERE ledger_id = %s AND user_id = %s)
+        ORDER BY m.role DESC, u.username
+    """, (ledger_id, ledger_id, user_id))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
+
+# --- GROUP AGGREGATES (read from ledger_daily_totals) ---
+_CONVERTED_TOTAL = """
+    (t.total * CASE WHEN t.currency = %(display_currency)s THEN 1
+                    WHEN %(display_currency)s = 'USD' THEN 1.0 / %(rate)s
+                    ELSE %(rate)s END)::float
+"""
+_LEDGER_FILTER = """
+    t.ledger_id = %(ledger_id)s AND t.entry_date BETWEEN %(start_date)s AND %(end_date)s
+    AND EXISTS (SELECT 1 FROM ledger_members WHERE ledger_id = %(ledger_id)s AND user_id = %(user_id)s)
+"""
+
+@st.cache_data
+def get_ledger_date_bounds(ledger_id, user_id):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT MIN(t.entry_date), MAX(t.entry_date) FROM ledger_daily_totals t
+        WHERE t.ledger_id = %s AND t.txn_count > 0
+          AND EXISTS (SELECT 1 FROM ledger_members WHERE ledger_id = %s AND user_id = %s)
+    """, (ledger_id, ledger_id, user_id))
+    bounds = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return bounds
+
+@st.cache_data
+def get_ledger_dashboard(ledger_id, user_id, start_date, end_date, display_currency):
+    """Group summary, daily, category and per-member totals, fetched concurrently."""
+    params = {"ledger_id": ledger_id, "user_id": user_id, "start_date": start_date, "end_date": end_date,
+              "display_currency": display_currency, "rate": KHR_TO_USD}
+    return fetch_concurrently({
+        "summary": (f"""
+            SELECT COALESCE(SUM({_CONVERTED_TOTAL}), 0) AS total,
+                   COALESCE(SUM(t.txn_count), 0) AS transactions,
+                   COUNT(DISTINCT t.entry_date) FILTER (WHERE t.txn_count > 0) AS active_days
+            FROM ledger_daily_totals t WHERE {_LEDGER_FILTER}
+        """, params),
+        "daily": (f"""
+            SELECT t.entry_date, SUM({_CONVERTED_TOTAL}) AS converted_amount
+            FROM ledger_daily_totals t WHERE {_LEDGER_FILTER}
+            GROUP BY t.entry_date ORDER BY t.entry_date
+        """, params),
+        "categories": (f"""
+            SELECT t.category_label, SUM({_CONVERTED_TOTAL}) AS converted_amount
+            FROM ledger_daily_totals t WHERE {_LEDGER_FILTER}
+            GROUP BY t.category_label HAVING SUM(t.txn_count) > 0
+            ORDER BY converted_amount DESC
+        """, params),
+        "members": (f"""
+            SELECT u.username, SUM({_CONVERTED_TOTAL}) AS converted_amount
+            FROM ledger_daily_totals t JOIN users u ON u.user_id = t.user_id
+            WHERE {_LEDGER_FILTER}
+            GROUP BY u.username HAVING SUM(t.txn_count) > 0
+            ORDER BY converted_amount DESC
+        """, params),
+    })
@@ -0,0 +1,239 @@
+# src/monthly_reports.py
+"""Precomputed summaries for closed months.
+
+Reports are written by a background worker at month rollover (or by the
+backfill mode of the CLI) so monthly questions become single-row lookups:
+
+    python -m src.monthly_reports            # compute last month's missing reports
+    python -m src.monthly_reports --backfill # compute every missing closed month
+    python -m src.monthly_reports --loop     # keep running, checking every hour
+
+Building a report and invalidating it on a write both take a per-(user,
+month) advisory lock, so a report computed from rows read before a write
+commits can never be stored after that write dropped it.
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import pandas as pd
+import streamlit as st
+from psycopg2.extras import Json
+from src.database import get_connection
+from src.budget_manager import month_start
+from src.schema import create_future_partitions
+from src.expense_archive import read_archived_expenses
+from src.utils import KHR_TO_USD
+
+MAX_WORKERS = 4
+CHECK_INTERVAL_SECONDS = 3600
+
+def previous_month(month):
+    return month_start(month - timedelta(days=1))
+
+def next_month(month):
+    return month_start(month + timedelta(days=31))
+
+def last_closed_month(today=None):
+    return previous_month(month_start(today or date.today()))
+
+def _totals_by(rows, key_index):
+    totals = defaultdict(float)
+    for row in rows:
+        totals[row[key_index]] += row[5]
+    return {k: round(v, 2) for k, v in sorted(totals.items(), key=lambda kv: -kv[1])}
+
+def _deltas(current, previous):
+    keys = set(current) | set(previous)
+    return {k: round(current.get(k, 0.0) - previous.get(k, 0.0), 2) for k in sorted(keys)}
+
+def _archived_rows(user_id, prev, month):
+    """The report query's grouped rows for whichever of the two months are archived."""
+    archived = read_archived_expenses(
+        user_id, prev, next_month(month) - timedelta(days=1),
+        ["entry_date", "category_label", "merchant_name", "payment_method", "amount", "currency"],
+    )
+    if archived.empty:
+        return []
+    amount = archived["amount"].astype(float)
+    archived["usd"] = amount.where(archived["currency"] != "KHR", amount / KHR_TO_USD)
+    archived["month"] = archived["entry_date"].map(month_start)
+    grouped = archived.groupby(["month", "category_label", "merchant_name", "payment_method"], dropna=False).agg(
+        count=("usd", "size"), usd=("usd", "sum")).reset_index()
+    grouped = grouped.astype(object).where(grouped.notna(), None)
+    return [(m, c, mer, p, int(n), float(usd)) for m, c, mer, p, n, usd in grouped.itertuples(index=False, name=None)]
+
+def compute_monthly_report(cursor, user_id, month):
+    """Summarises one month (in USD) together with its deltas against the month before."""
+    month = month_start(month)
+    prev = previous_month(month)
+    cursor.execute("""
+        SELECT date_trunc('month', entry_date)::date, category_label, merchant_name,
+               payment_method, COUNT(*),
+               SUM(CASE WHEN currency = 'KHR' THEN amount / %s ELSE amount END)::float
+        FROM expenses
+        WHERE user_id = %s AND entry_date >= %s AND entry_date < %s
+        GROUP BY 1, 2, 3, 4
+    """, (KHR_TO_USD, user_id, prev, next_month(month)))
+    rows = cursor.fetchall() + _archived_rows(user_id, prev, month)
+    current = [r for r in rows if r[0] == month]
+    before = [r for r in rows if r[0] == prev]
+
+    by_category = _totals_by(current, 1)
+    prev_by_category = _totals_by(before, 1)
+    total = round(sum(r[5] for r in current), 2)
+    prev_total = round(sum(r[5] for r in before), 2)
+    return {
+        "month": month.isoformat(),
+        "currency": "USD",
+        "total": total,
+        "transactions": sum(r[4] for r in current),
+        "by_category": by_category,
+        "by_merchant": _totals_by(current, 2),
+        "by_payment_method": _totals_by(current, 3),
+        "previous_total": prev_total,
+        "total_delta": round(total - prev_total, 2),
+        "category_deltas": _deltas(by_category, prev_by_category),
+    }
+
+def store_monthly_report(cursor, user_id, month, report):
+    cursor.execute("""
+        INSERT INTO monthly_reports (user_id, month_start, report, computed_at)
+        VALUES (%s, %s, %s, NOW())
+        ON CONFLICT (user_id, month_start)
+        DO UPDATE SET report = EXCLUDED.report, computed_at = NOW()
+    """, (user_id, month_start(month), Json(report)))
+
+def lock_report(cursor, user_id, month):
+    """Serializes building and invalidating one report until the caller's transaction ends."""
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"monthly_report:{user_id}:{month_start(month)}",))
+
+def invalidate_reports(cursor, deltas):
+    """Drops reports made stale by a write to a closed month (and the following month's deltas)."""
+    current = month_start(date.today())
+    stale = set()
+    for d in deltas:
+        month = month_start(d.entry_date)
+        if month < current:
+            stale.add((d.user_id, month))
+            stale.add((d.user_id, next_month(month)))
+    # sorted, so concurrent writers take the locks in the same order
+    for user_id, month in sorted(stale, key=lambda key: (str(key[0]), key[1])):
+        lock_report(cursor, user_id, month)
+        cursor.execute("DELETE FROM monthly_reports WHERE user_id = %s AND month_start = %s", (user_id, month))
+
+def get_monthly_report(user_id, month):
+    """Reads a stored report; closed months missing one are computed and stored on the spot."""
+    month = month_start(month)
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT report FROM monthly_reports WHERE user_id = %s AND month_start = %s", (user_id, month))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        if month >= month_start(date.today()):
+            return compute_monthly_report(cursor, user_id, month)
+        lock_report(cursor, user_id, month)
+        # another builder may have stored it while we waited
+        cursor.execute("SELECT report FROM monthly_reports WHERE user_id = %s AND month_start = %s", (user_id, month))
+        row = cursor.fetchone()
+        if row:
+            conn.commit()
+            return row[0]
+        report = compute_monthly_report(cursor, user_id, month)
+        store_monthly_report(cursor, user_id, month, report)
+        conn.commit()
+        return report
+    finally:
+        cursor.close()
+        conn.close()
+
+def _build_report(user_id, month):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        lock_report(cursor, user_id, month)
+        store_monthly_report(cursor, user_id, month, compute_monthly_report(cursor, user_id, month))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def _missing_reports(month=None, user_id=None):
+    """(user_id, month) pairs that have expenses but no stored report, up to the last closed month."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    filters = ["date_trunc('month', e.entry_date)::date <= %s"]
+    params = [last_closed_month()]
+    if month is not None:
+        filters.append("date_trunc('month', e.entry_date)::date = %s")
+        params.append(month_start(month))
+    if user_id is not None:
+        filters.append("e.user_id = %s")
+        params.append(user_id)
+    cursor.execute(f"""
+        SELECT DISTINCT e.user_id, date_trunc('month', e.entry_date)::date
+        FROM expenses e
+        LEFT JOIN monthly_reports r
+          ON r.user_id = e.user_id AND r.month_start = date_trunc('month', e.entry_date)::date
+        WHERE r.user_id IS NULL AND {' AND '.join(filters)}
+    """, params)
+    pending = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return pending
+
+def run_reports(month=None, user_id=None, max_workers=MAX_WORKERS):
+    """Computes the missing reports on a thread pool; returns how many were written."""
+    pending = _missing_reports(month, user_id)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for future in [pool.submit(_build_report, u, m) for u, m in pending]:
+            future.result()
+    return len(pending)
+
+def run_rollover():
+    return run_reports(month=last_closed_month())
+
+def run_backfill(user_id=None):
+    return run_reports(user_id=user_id)
+
+def _scheduler_loop(interval):
+    while True:
+        try:
+            run_rollover()
+        except Exception as e:
+            print(f"Monthly report rollover failed: {e}")
+        try:
+            create_future_partitions()
+        except Exception as e:
+            print(f"Creating future expense partitions failed: {e}")
+        time.sleep(interval)
+
+@st.cache_resource
+def start_report_scheduler(interval=CHECK_INTERVAL_SECONDS):
+    """Starts the in-process rollover worker once per server process."""
+    thread = threading.Thread(target=_scheduler_loop, args=(interval,), name="monthly-reports", daemon=True)
+    thread.start()
+    return thread
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute closed-month expense reports.")
+    parser.add_argument("--backfill", action="store_true", help="compute every missing closed month, not just last month")
+    parser.add_argument("--user", help="limit to one user_id")
+    parser.add_argument("--loop", action="store_true", help="keep running and check for rollover periodically")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    if args.backfill:
+        written = run_reports(user_id=args.user, max_workers=args.workers)
+    else:
+        written = run_reports(month=last_closed_month(), user_id=args.user, max_workers=args.workers)
+    print(f"Wrote {written} monthly report(s).")
+    if args.loop:
+        _scheduler_loop(CHECK_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
+    main()
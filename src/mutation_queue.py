@@ -0,0 +1,72 @@
+# src/mutation_queue.py
+"""Write-behind queue that groups expense mutations into batched transactions.
+
+Callers get a `concurrent.futures.Future` per mutation and carry on; a single
+writer thread drains the queue every `flush_interval` seconds (or once
+`max_batch` mutations are waiting) and hands the batch to a writer function
+that applies it in one transaction. `flush()` blocks until everything
+submitted so far is durable, and is also run at interpreter exit.
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+FLUSH_INTERVAL = 0.2  # seconds
+MAX_BATCH = 100
+
+Mutation = namedtuple("Mutation", ["kind", "user_id", "args", "future"])
+
+_FLUSH = "flush"
+
+class MutationQueue:
+    def __init__(self, writer, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self._writer = writer
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="expense-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush, 30)
+
+    def submit(self, kind, user_id, args):
+        """Queues one mutation; the returned future resolves once it is committed."""
+        future = Future()
+        self._queue.put(Mutation(kind, user_id, args, future))
+        return future
+
+    def flush(self, timeout=None):
+        """Blocks until every mutation submitted before this call has been written."""
+        barrier = Future()
+        self._queue.put(Mutation(_FLUSH, None, None, barrier))
+        return barrier.result(timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._max_batch and batch[-1].kind != _FLUSH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            mutations = [m for m in batch if m.kind != _FLUSH]
+            if mutations:
+                try:
+                    self._writer(mutations)
+                except Exception as e:
+                    for m in mutations:
+                        if not m.future.done():
+                            m.future.set_exception(e)
+            for m in batch:
+                if m.kind == _FLUSH:
+                    m.future.set_result(True)
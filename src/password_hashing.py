@@ -0,0 +1,134 @@
+# src/password_hashing.py
+"""Password hashing with a tunable stdlib KDF.
+
+Hashes are self-describing so the cost can be raised without breaking old
+accounts:
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+
+Legacy unsalted sha256 hex digests are still verified and reported as
+needing a rehash. The KDF work runs on a bounded thread pool (hashlib
+releases the GIL while deriving), so a burst of logins can't pile unbounded
+CPU work onto the Streamlit script threads.
+
+Cost is configured through environment variables (AUTH_KDF, AUTH_SCRYPT_N,
+AUTH_PBKDF2_ITERATIONS, AUTH_HASH_WORKERS). To measure throughput:
+
+    python -m src.password_hashing --kdf scrypt --costs 8192 16384 32768
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+KDF = os.environ.get("AUTH_KDF", "scrypt")
+SCRYPT_N = int(os.environ.get("AUTH_SCRYPT_N", 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = int(os.environ.get("AUTH_PBKDF2_ITERATIONS", 600_000))
+HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", os.cpu_count() or 2))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+
+def _b64(raw):
+    return base64.b64encode(raw).decode()
+
+def _derive(password, kdf, cost, salt, r=SCRYPT_R, p=SCRYPT_P):
+    if kdf == "scrypt":
+        return hashlib.scrypt(password.encode(), salt=salt, n=cost, r=r, p=p,
+                              maxmem=256 * r * (cost + p), dklen=KEY_BYTES)
+    if kdf == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, cost, dklen=KEY_BYTES)
+    raise ValueError(f"Unknown KDF: {kdf}")
+
+def _default_cost(kdf):
+    return SCRYPT_N if kdf == "scrypt" else PBKDF2_ITERATIONS
+
+def hash_password(password, kdf=None, cost=None):
+    kdf = kdf or KDF
+    cost = cost or _default_cost(kdf)
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _b64(_derive(password, kdf, cost, salt))
+    if kdf == "scrypt":
+        return f"scrypt${cost}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${key}"
+    return f"pbkdf2_sha256${cost}${_b64(salt)}${key}"
+
+def verify_password(password, stored):
+    """Returns `(matches, needs_rehash)` for a stored hash in any supported format."""
+    parts = stored.split("$")
+    if len(parts) == 1:
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        matches = hmac.compare_digest(legacy, stored)
+        return matches, matches
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            kdf, cost, salt, key = "scrypt", int(parts[1]), parts[4], parts[5]
+            params = {"r": int(parts[2]), "p": int(parts[3])}
+            current = (params["r"], params["p"]) == (SCRYPT_R, SCRYPT_P)
+        elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            kdf, cost, salt, key = "pbkdf2_sha256", int(parts[1]), parts[2], parts[3]
+            params, current = {}, True
+        else:
+            return False, False
+        derived = _b64(_derive(password, kdf, cost, base64.b64decode(salt, validate=True), **params))
+    except ValueError:
+        # non-numeric cost, bad base64 salt or parameters the KDF rejects
+        return False, False
+    matches = hmac.compare_digest(derived, key)
+    return matches, matches and not (current and kdf == KDF and cost == _default_cost(kdf))
+
+def hash_password_async(password):
+    return _pool.submit(hash_password, password)
+
+def verify_password_async(password, stored):
+    return _pool.submit(verify_password, password, stored)
+
+# Verified when an email is unknown, so the response time doesn't reveal whether it exists.
+DUMMY_HASH = hash_password(secrets.token_urlsafe(16))
+
+def run_benchmark(kdf, cost, workers, seconds):
+    """Verifies one password repeatedly on `workers` threads; returns (logins/s, mean latency ms)."""
+    stored = hash_password("benchmark-password", kdf, cost)
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        count, busy = 0, 0.0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            verify_password("benchmark-password", stored)
+            busy += time.perf_counter() - start
+            count += 1
+        return count, busy
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = [f.result() for f in [pool.submit(worker) for _ in range(workers)]]
+    elapsed = time.perf_counter() - started
+    logins = sum(c for c, _ in results)
+    return logins / elapsed, sum(b for _, b in results) / max(logins, 1) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login (password verification) throughput.")
+    parser.add_argument("--kdf", choices=["scrypt", "pbkdf2_sha256"], default=KDF)
+    parser.add_argument("--costs", type=int, nargs="+",
+                        help="scrypt N values or PBKDF2 iteration counts (default: the configured cost)")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    cores = min(args.workers, os.cpu_count() or 1)
+    print(f"{args.kdf}, {args.workers} worker thread(s) on {os.cpu_count()} CPU(s)")
+    print(f"{'cost':>10} {'latency ms':>11} {'logins/s':>10} {'logins/s/core':>14}")
+    for cost in args.costs or [_default_cost(args.kdf)]:
+        rate, latency = run_benchmark(args.kdf, cost, args.workers, args.seconds)
+        print(f"{cost:>10} {latency:>11.1f} {rate:>10.1f} {rate / cores:>14.1f}")
+
+if __name__ == "__main__":
+    main()
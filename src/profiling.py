@@ -0,0 +1,162 @@
+# src/profiling.py
+"""On-demand profiling of Streamlit reruns.
+
+Enable it for the whole server with an environment variable, or per browser
+tab with a query parameter. The query parameter is honoured only when the
+server opts in with EXPENSE_PROFILE_ALLOW_QUERY=1, since anyone who can reach
+the app could otherwise write dumps to its disk:
+
+    EXPENSE_PROFILE=rerun streamlit run app.py
+    ?profile=rerun        profile the whole rerun of main()
+    ?profile=dashboard    profile only that page (expense, dashboard, chatbot, user_profile)
+
+Each profiled section writes `<timestamp>_<label>.pstats` (cProfile) and
+`<timestamp>_<label>.collapsed` (sampled stacks, one `frame;frame;... count`
+line per stack, ready for flamegraph tools) to EXPENSE_PROFILE_DIR
+(default: profiles/). Only the newest EXPENSE_PROFILE_MAX_DUMPS sections
+(default 50) are kept. Summarize the saved dumps with:
+
+    python -m src.profiling [profile_dir] --top 25
+"""
+import argparse
+import cProfile
+import glob
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import streamlit as st
+
+PROFILE_DIR = os.environ.get("EXPENSE_PROFILE_DIR", "profiles")
+ALLOW_QUERY = os.environ.get("EXPENSE_PROFILE_ALLOW_QUERY", "") == "1"
+MAX_DUMPS = int(os.environ.get("EXPENSE_PROFILE_MAX_DUMPS", 50))
+SAMPLE_INTERVAL = 0.005  # seconds
+
+_active = threading.local()
+
+def _requested_targets():
+    targets = set(filter(None, os.environ.get("EXPENSE_PROFILE", "").lower().split(",")))
+    if not ALLOW_QUERY:
+        return targets
+    try:
+        targets.update(filter(None, st.query_params.get("profile", "").lower().split(",")))
+    except Exception:
+        pass
+    return targets
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+def _log(message):
+    print(f"[profiling] {message}", file=sys.stderr)
+
+def _prune(profile_dir, keep):
+    """Deletes all but the newest `keep` dumps (names start with their timestamp)."""
+    dumps = {}
+    for path in glob.glob(os.path.join(profile_dir, "*.pstats")) + glob.glob(os.path.join(profile_dir, "*.collapsed")):
+        dumps.setdefault(os.path.splitext(path)[0], []).append(path)
+    for base in sorted(dumps)[:max(len(dumps) - keep, 0)]:
+        for path in dumps[base]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already removed by a concurrent rerun
+
+def _save(label, profiler, sampler, profile_dir):
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, f"{datetime.now():%Y%m%d-%H%M%S-%f}_{label}")
+    if profiler is not None:
+        profiler.dump_stats(f"{base}.pstats")
+    with open(f"{base}.collapsed", "w") as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    _prune(profile_dir, MAX_DUMPS)
+    return base
+
+@contextmanager
+def profile_section(label, profile_dir=None):
+    """Profiles the wrapped block when `label` (or "all") is requested; otherwise does nothing."""
+    targets = _requested_targets()
+    if getattr(_active, "running", False) or not (label in targets or "all" in targets):
+        yield
+        return
+
+    _active.running = True
+    profiler = cProfile.Profile()
+    sampler = _StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    try:
+        sampler.start()
+        try:
+            profiler.enable()
+        except Exception as e:
+            # Python 3.12+ allows one cProfile session per process, so a concurrent rerun may hold it
+            _log(f"cProfile unavailable for {label} ({e}); saving sampled stacks only")
+            profiler = None
+        yield
+    finally:
+        # Runs on st.rerun()/st.stop() too, which end a rerun by raising
+        if profiler is not None:
+            profiler.disable()
+        if sampler.ident is not None:
+            sampler.stop()
+        _active.running = False
+        base = _save(label, profiler, sampler, profile_dir or PROFILE_DIR)
+        _log(f"{label} took {time.perf_counter() - started:.3f}s -> {base}.*")
+
+def summarize(profile_dir, top, sort):
+    dumps = sorted(glob.glob(os.path.join(profile_dir, "*.pstats")))
+    if not dumps:
+        print(f"No .pstats files in {profile_dir}")
+        return
+    print(f"=== {len(dumps)} profile(s) in {profile_dir}, top {top} by {sort} ===")
+    pstats.Stats(*dumps).strip_dirs().sort_stats(sort).print_stats(top)
+
+    self_samples = Counter()
+    for path in glob.glob(os.path.join(profile_dir, "*.collapsed")):
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                self_samples[stack.rsplit(";", 1)[-1]] += int(count)
+    if self_samples:
+        total = sum(self_samples.values())
+        print(f"=== Hottest frames by sampled self time ({total} samples) ===")
+        for frame, count in self_samples.most_common(top):
+            print(f"{count / total:6.1%}  {count:7d}  {frame}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize saved rerun profiles.")
+    parser.add_argument("profile_dir", nargs="?", default=PROFILE_DIR)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--sort", default="cumulative", choices=["cumulative", "tottime", "ncalls"])
+    args = parser.parse_args()
+    summarize(args.profile_dir, args.top, args.sort)
+
+if __name__ == "__main__":
+    main()
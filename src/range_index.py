@@ -0,0 +1,256 @@
+# src/range_index.py
+"""Per-user prefix-sum index over daily spend.
+
+For each user we keep one cumulative daily-sum array per (currency, category),
+so the total for any `[start, end]` window is two lookups:
+
+    cumulative[..., end + 1] - cumulative[..., start]
+
+The index is built once from a grouped daily query and then patched in place
+with the deltas of every committed expense write.
+
+Every expense write also bumps the user's row in `expense_versions` inside
+its transaction. An index remembers the version it reflects. A patch is only
+applied on top of the version just before it; otherwise (a write from another
+process was missed) the index is dropped and rebuilt. Readers re-check the
+stored version at most every VERSION_CHECK_SECONDS. A per-user lock is held
+from a write's version bump to its patch, and across a build's load and
+store, so no write can fall between a build and the patches it needs.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+import numpy as np
+import streamlit as st
+from src.database import get_connection
+from src.expense_archive import archived_daily_totals
+from src.utils import convert_to_currency
+
+VERSION_CHECK_SECONDS = 5
+
+class RangeIndex:
+    def __init__(self, origin, currencies, categories, cumulative):
+        self.origin = origin
+        self.currencies = list(currencies)
+        self.categories = list(categories)
+        self.cumulative = cumulative  # shape: (currencies, categories, days + 1)
+        self.version = 0  # the user's expense_versions value this index reflects
+        self.checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_daily_rows(cls, rows, today=None):
+        """Builds the index from `(entry_date, currency, category_label, amount)` rows."""
+        today = today or date.today()
+        origin = min((r[0] for r in rows), default=today)
+        last = max([r[0] for r in rows] + [today])
+        currencies = sorted({r[1] for r in rows})
+        categories = sorted({r[2] for r in rows})
+        daily = np.zeros((len(currencies), len(categories), (last - origin).days + 2))
+        if rows:
+            cur_pos = {c: i for i, c in enumerate(currencies)}
+            cat_pos = {c: i for i, c in enumerate(categories)}
+            np.add.at(
+                daily,
+                (
+                    np.array([cur_pos[r[1]] for r in rows]),
+                    np.array([cat_pos[r[2]] for r in rows]),
+                    np.array([(r[0] - origin).days + 1 for r in rows]),
+                ),
+                np.array([float(r[3]) for r in rows]),
+            )
+        return cls(origin, currencies, categories, np.cumsum(daily, axis=2))
+
+    @property
+    def last_day(self):
+        return self.origin + timedelta(days=self.cumulative.shape[2] - 2)
+
+    def _grow(self, day):
+        if day < self.origin:
+            pad = (self.origin - day).days
+            self.cumulative = np.concatenate(
+                [np.zeros(self.cumulative.shape[:2] + (pad,)), self.cumulative], axis=2)
+            self.origin = day
+        elif day > self.last_day:
+            pad = (day - self.last_day).days
+            tail = np.repeat(self.cumulative[:, :, -1:], pad, axis=2)
+            self.cumulative = np.concatenate([self.cumulative, tail], axis=2)
+
+    def _slot(self, currency, category_label):
+        if currency not in self.currencies:
+            self.currencies.append(currency)
+            self.cumulative = np.concatenate(
+                [self.cumulative, np.zeros((1,) + self.cumulative.shape[1:])], axis=0)
+        if category_label not in self.categories:
+            self.categories.append(category_label)
+            shape = self.cumulative.shape
+            self.cumulative = np.concatenate(
+                [self.cumulative, np.zeros((shape[0], 1, shape[2]))], axis=1)
+        return self.currencies.index(currency), self.categories.index(category_label)
+
+    def patch(self, deltas, version=None):
+        """Applies committed expense deltas: adds each amount to every prefix from its day on."""
+        with self._lock:
+            for d in deltas:
+                self._grow(d.entry_date)
+                cur, cat = self._slot(d.currency, d.category_label)
+                self.cumulative[cur, cat, (d.entry_date - self.origin).days + 1:] += float(d.amount)
+            self.version = self.version + 1 if version is None else version
+
+    def _window(self, start, end):
+        """Per-(currency, category) totals for `[start, end]`, in original currencies."""
+        with self._lock:
+            start, end = max(start, self.origin), min(end, self.last_day)
+            if start > end:
+                return np.zeros(self.cumulative.shape[:2])
+            s = (start - self.origin).days
+            e = (end - self.origin).days + 1
+            return self.cumulative[:, :, e] - self.cumulative[:, :, s]
+
+    def daily_matrix(self, start, end, display_currency="USD"):
+        """Daily spend per category for `[start, end]` as a (categories, days) array."""
+        days = (end - start).days + 1
+        with self._lock:
+            s = (start - self.origin).days
+            # Clamp into the stored span; days outside it have no spend
+            cols = np.clip(np.arange(s, s + days + 1), 0, self.cumulative.shape[2] - 1)
+            daily = np.diff(self.cumulative[:, :, cols], axis=2)
+            categories, rates = list(self.categories), self._rates(display_currency)
+        return categories, np.tensordot(rates, daily, axes=1)
+
+    def _rates(self, display_currency):
+        return np.array([convert_to_currency(1.0, c, display_currency) for c in self.currencies])
+
+    def category_totals(self, start, end, display_currency="USD"):
+        """`{category_label: total}` for `[start, end]` in the display currency (non-zero only)."""
+        totals = self._rates(display_currency) @ self._window(start, end)
+        return {c: float(t) for c, t in zip(self.categories, totals) if round(t, 2) != 0}
+
+    def total(self, start, end, display_currency="USD"):
+        return float(self._rates(display_currency) @ self._window(start, end).sum(axis=1))
+
+@st.cache_resource
+def _index_store():
+    return {"lock": threading.Lock(), "indexes": {}, "user_locks": defaultdict(threading.Lock)}
+
+def _user_lock(user_id):
+    store = _index_store()
+    with store["lock"]:
+        return store["user_locks"][user_id]
+
+@contextmanager
+def hold_range_indexes(user_ids):
+    """Blocks index builds for `user_ids` (taken by the writer from version bump to patch)."""
+    locks = [_user_lock(u) for u in sorted(set(user_ids))]
+    for lock in locks:
+        lock.acquire()
+    try:
+        yield
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+
+def bump_data_versions(cursor, user_ids):
+    """Increments each user's data version in the caller's transaction; returns `{user_id: version}`."""
+    versions = {}
+    for user_id in sorted(set(user_ids)):
+        cursor.execute("""
+            INSERT INTO expense_versions (user_id, version) VALUES (%s, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = expense_versions.version + 1
+            RETURNING version
+        """, (user_id,))
+        versions[user_id] = cursor.fetchone()[0]
+    return versions
+
+def _stored_version(cursor, user_id):
+    cursor.execute("SELECT version FROM expense_versions WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def _load_daily_rows(user_id):
+    """`(version, rows)`; the version is read first, so a concurrent write can only make it look stale."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    version = _stored_version(cursor, user_id)
+    cursor.execute("""
+        SELECT entry_date, currency, category_label, SUM(amount)
+        FROM expenses WHERE user_id = %s
+        GROUP BY entry_date, currency, category_label
+    """, (user_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return version, rows + archived_daily_totals(user_id)
+
+def _is_current(user_id, index):
+    conn = get_connection()
+    cursor = conn.cursor()
+    current = _stored_version(cursor, user_id) == index.version
+    cursor.close()
+    conn.close()
+    return current
+
+def get_range_index(user_id):
+    """Returns the user's index, (re)building it when it is missing or behind the stored version."""
+    store = _index_store()
+    with store["lock"]:
+        index = store["indexes"].get(user_id)
+    if index is not None and time.monotonic() - index.checked_at < VERSION_CHECK_SECONDS:
+        return index
+    with _user_lock(user_id):
+        with store["lock"]:
+            index = store["indexes"].get(user_id)
+        if index is not None and time.monotonic() - index.checked_at < VERSION_CHECK_SECONDS:
+            return index
+        if index is not None and _is_current(user_id, index):
+            index.checked_at = time.monotonic()
+            return index
+        version, rows = _load_daily_rows(user_id)
+        index = RangeIndex.from_daily_rows(rows)
+        index.version = version
+        with store["lock"]:
+            store["indexes"][user_id] = index
+    return index
+
+def patch_range_indexes(deltas, versions):
+    """Folds committed deltas into indexes already built (call under `hold_range_indexes`).
+
+    An index that missed an earlier write is dropped instead, to be rebuilt on next use.
+    """
+    store = _index_store()
+    by_user = {}
+    for d in deltas:
+        by_user.setdefault(d.user_id, []).append(d)
+    with store["lock"]:
+        indexes = {u: store["indexes"].get(u) for u in by_user}
+    for user_id, index in indexes.items():
+        if index is None:
+            continue
+        if index.version == versions[user_id] - 1:
+            index.patch(by_user[user_id], versions[user_id])
+        else:
+            with store["lock"]:
+                store["indexes"].pop(user_id, None)
+
+def data_version(user_id):
+    return get_range_index(user_id).version
+
+def compare_periods(user_id, period_a, period_b, display_currency="USD"):
+    """Compares two `(start, end)` periods; each total is two lookups per series."""
+    index = get_range_index(user_id)
+    cats_a = index.category_totals(*period_a, display_currency)
+    cats_b = index.category_totals(*period_b, display_currency)
+    total_a, total_b = sum(cats_a.values()), sum(cats_b.values())
+    by_category = {
+        c: {"a": cats_a.get(c, 0.0), "b": cats_b.get(c, 0.0), "delta": cats_b.get(c, 0.0) - cats_a.get(c, 0.0)}
+        for c in sorted(set(cats_a) | set(cats_b))
+    }
+    return {
+        "a": total_a,
+        "b": total_b,
+        "delta": total_b - total_a,
+        "pct_change": (total_b - total_a) / total_a * 100 if total_a else None,
+        "by_category": by_category,
+    }
@@ -0,0 +1,299 @@
+# src/schema.py
+"""Schema tooling for the tables layered on top of users/expenses.
+
+    python -m src.schema migrate                   # create/upgrade derived tables
+    python -m src.schema partition                 # convert expenses to monthly range partitions
+    python -m src.schema create-partitions         # create the next months' partitions
+    python -m src.schema archive --before 2024-01  # move older partitions to Parquet
+"""
+import argparse
+from datetime import date
+import pandas as pd
+import streamlit as st
+from src.database import get_connection
+from src.budget_manager import month_start, rebuild_budget_totals
+from src.anomaly_detector import rebuild_anomaly_stats
+from src.ledger_manager import rebuild_ledger_totals
+from src.expense_archive import partition_name, stage_archive, staged_months, publish_archive, discard_staged_archive, write_missing_manifests
+
+FUTURE_PARTITION_MONTHS = 3
+
+BUDGET_DDL = """
+    CREATE TABLE IF NOT EXISTS budgets (
+        user_id VARCHAR(50) NOT NULL,
+        category_label VARCHAR(50) NOT NULL,
+        monthly_limit NUMERIC(14, 2) NOT NULL CHECK (monthly_limit > 0),
+        currency VARCHAR(3) NOT NULL,
+        PRIMARY KEY (user_id, category_label)
+    );
+    CREATE TABLE IF NOT EXISTS budget_totals (
+        user_id VARCHAR(50) NOT NULL,
+        month_start DATE NOT NULL,
+        category_label VARCHAR(50) NOT NULL,
+        currency VARCHAR(3) NOT NULL,
+        total NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month_start, category_label, currency)
+    );
+"""
+
+MONTHLY_REPORTS_DDL = """
+    CREATE TABLE IF NOT EXISTS monthly_reports (
+        user_id VARCHAR(50) NOT NULL,
+        month_start DATE NOT NULL,
+        report JSONB NOT NULL,
+        computed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (user_id, month_start)
+    );
+"""
+
+# KDF hashes are longer than the 64-char sha256 digests the column was sized for
+PASSWORD_HASH_DDL = """
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'users' AND column_name = 'password_hash') <> 'text' THEN
+            ALTER TABLE users ALTER COLUMN password_hash TYPE TEXT;
+        END IF;
+    END $$;
+"""
+ANOMALY_DDL = """
+    CREATE TABLE IF NOT EXISTS category_stats (
+        user_id VARCHAR(50) NOT NULL,
+        category_label VARCHAR(50) NOT NULL,
+        observations INTEGER NOT NULL,
+        ewm_mean DOUBLE PRECISION NOT NULL,
+        ewm_var DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (user_id, category_label)
+    );
+    CREATE TABLE IF NOT EXISTS expense_anomalies (
+        item_id VARCHAR(64) PRIMARY KEY,
+        user_id VARCHAR(50) NOT NULL,
+        entry_date DATE NOT NULL,
+        category_label VARCHAR(50) NOT NULL,
+        merchant_name VARCHAR(100),
+        amount_usd DOUBLE PRECISION NOT NULL,
+        expected_usd DOUBLE PRECISION NOT NULL,
+        score DOUBLE PRECISION NOT NULL,
+        flagged_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS expense_anomalies_user_date_idx ON expense_anomalies (user_id, entry_date);
+"""
+
+LEDGER_DDL = """
+    CREATE TABLE IF NOT EXISTS ledgers (
+        ledger_id SERIAL PRIMARY KEY,
+        name VARCHAR(50) NOT NULL,
+        owner_id VARCHAR(50) NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    CREATE TABLE IF NOT EXISTS ledger_members (
+        ledger_id INTEGER NOT NULL REFERENCES ledgers ON DELETE CASCADE,
+        user_id VARCHAR(50) NOT NULL,
+        role VARCHAR(10) NOT NULL DEFAULT 'member',
+        joined_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (ledger_id, user_id)
+    );
+    CREATE INDEX IF NOT EXISTS ledger_members_user_idx ON ledger_members (user_id);
+    ALTER TABLE expenses ADD COLUMN IF NOT EXISTS ledger_id INTEGER;
+    CREATE INDEX IF NOT EXISTS expenses_ledger_date_idx ON expenses (ledger_id, entry_date) WHERE ledger_id IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS ledger_daily_totals (
+        ledger_id INTEGER NOT NULL REFERENCES ledgers ON DELETE CASCADE,
+        entry_date DATE NOT NULL,
+        category_label VARCHAR(50) NOT NULL,
+        currency VARCHAR(3) NOT NULL,
+        user_id VARCHAR(50) NOT NULL,
+        total NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        txn_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (ledger_id, entry_date, category_label, currency, user_id)
+    );
+"""
+
+# Bumped by every expense write; cached per-user views compare against it
+DATA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS expense_versions (
+        user_id VARCHAR(50) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    );
+"""
+
+# (sentinel table, DDL, backfill run once when the sentinel table is new)
+MIGRATIONS = [
+    ("budget_totals", BUDGET_DDL, rebuild_budget_totals),
+    ("monthly_reports", MONTHLY_REPORTS_DDL, None),
+    ("users", PASSWORD_HASH_DDL, None),
+    ("category_stats", ANOMALY_DDL, rebuild_anomaly_stats),
+    ("ledger_daily_totals", LEDGER_DDL, rebuild_ledger_totals),
+    ("expense_versions", DATA_VERSION_DDL, None),
+]
+
+def apply_migrations(cursor):
+    for sentinel, ddl, backfill in MIGRATIONS:
+        cursor.execute("SELECT to_regclass(%s) IS NULL", (sentinel,))
+        is_new = cursor.fetchone()[0]
+        cursor.execute(ddl)
+        if is_new and backfill:
+            backfill(cursor)
+
+@st.cache_resource
+def ensure_schema():
+    """Creates the tables layered on top of the base users/expenses schema (once per process)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        apply_migrations(cursor)
+        ensure_future_partitions(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return True
+
+
+# --- MONTHLY RANGE PARTITIONS ON expenses.entry_date ---
+def _add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('expenses')")
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+def create_month_partition(cursor, month):
+    """Creates one month's partition, moving any rows that landed in the default partition."""
+    name = partition_name(month)
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cursor.fetchone()[0]:
+        return False
+    upper = _add_months(month, 1)
+    cursor.execute("ALTER TABLE expenses DETACH PARTITION expenses_default")
+    cursor.execute(f"CREATE TABLE {name} PARTITION OF expenses FOR VALUES FROM (%s) TO (%s)", (month, upper))
+    cursor.execute("""
+        WITH moved AS (
+            DELETE FROM expenses_default WHERE entry_date >= %s AND entry_date < %s RETURNING *
+        )
+        INSERT INTO expenses SELECT * FROM moved
+    """, (month, upper))
+    cursor.execute("ALTER TABLE expenses ATTACH PARTITION expenses_default DEFAULT")
+    return True
+
+def ensure_future_partitions(cursor, months_ahead=FUTURE_PARTITION_MONTHS, today=None):
+    """Makes sure the current month and the next `months_ahead` months have partitions."""
+    if not is_partitioned(cursor):
+        return 0
+    current = month_start(today or date.today())
+    return sum(create_month_partition(cursor, _add_months(current, n)) for n in range(months_ahead + 1))
+
+def partition_expenses_table(cursor):
+    """One-off conversion of `expenses` into a table range-partitioned by month on entry_date."""
+    if is_partitioned(cursor):
+        return False
+    cursor.execute("ALTER TABLE expenses RENAME TO expenses_unpartitioned")
+    cursor.execute("""
+        CREATE TABLE expenses (LIKE expenses_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE (entry_date)
+    """)
+    cursor.execute("ALTER TABLE expenses ADD PRIMARY KEY (item_id, entry_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS expenses_user_date_idx ON expenses (user_id, entry_date)")
+    cursor.execute("CREATE TABLE expenses_default PARTITION OF expenses DEFAULT")
+
+    cursor.execute("SELECT MIN(entry_date), MAX(entry_date) FROM expenses_unpartitioned")
+    first, last = cursor.fetchone()
+    if first is not None:
+        month = month_start(first)
+        while month <= last:
+            create_month_partition(cursor, month)
+            month = _add_months(month, 1)
+    ensure_future_partitions(cursor)
+    cursor.execute("INSERT INTO expenses SELECT * FROM expenses_unpartitioned")
+    cursor.execute("DROP TABLE expenses_unpartitioned")
+    return True
+
+def archive_partitions(cursor, before, archive_dir=None):
+    """Stages every monthly partition ending on or before `before` as Parquet, then drops it.
+
+    The staged files are published by `settle_staged_archives` after the caller commits.
+    """
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('expenses') AND c.relname ~ '^expenses_y[0-9]{4}m[0-9]{2}$'
+        ORDER BY c.relname
+    """)
+    archived = []
+    for (name,) in cursor.fetchall():
+        month = date(int(name[10:14]), int(name[15:17]), 1)
+        if _add_months(month, 1) > month_start(before):
+            continue
+        cursor.execute(f"SELECT * FROM {name}")
+        columns = [desc[0] for desc in cursor.description]
+        stage_archive(pd.DataFrame(cursor.fetchall(), columns=columns), month, archive_dir)
+        cursor.execute(f"ALTER TABLE expenses DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+        archived.append(month)
+    return archived
+
+def settle_staged_archives(cursor, archive_dir=None):
+    """Publishes staged months whose partition is gone (drop committed); discards the others."""
+    published = []
+    for month in staged_months(archive_dir):
+        cursor.execute("SELECT to_regclass(%s) IS NULL", (partition_name(month),))
+        if cursor.fetchone()[0]:
+            publish_archive(month, archive_dir)
+            published.append(month)
+        else:
+            discard_staged_archive(month, archive_dir)
+    return published
+
+def create_future_partitions(months_ahead=FUTURE_PARTITION_MONTHS):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        created = ensure_future_partitions(cursor, months_ahead)
+        conn.commit()
+        return created
+    finally:
+        cursor.close()
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Schema tooling for the expense tracker.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="create/upgrade the derived tables")
+    sub.add_parser("partition", help="convert expenses to monthly range partitions")
+    create = sub.add_parser("create-partitions", help="create partitions for the coming months")
+    create.add_argument("--months-ahead", type=int, default=FUTURE_PARTITION_MONTHS)
+    archive = sub.add_parser("archive", help="move old partitions to the Parquet archive")
+    archive.add_argument("--before", required=True, help="YYYY-MM; partitions for earlier months are archived")
+    archive.add_argument("--archive-dir")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if args.command == "migrate":
+            apply_migrations(cursor)
+            print("Derived tables are up to date.")
+        elif args.command == "partition":
+            print("Partitioned expenses." if partition_expenses_table(cursor) else "expenses is already partitioned.")
+        elif args.command == "create-partitions":
+            print(f"Created {ensure_future_partitions(cursor, args.months_ahead)} partition(s).")
+        elif args.command == "archive":
+            before = date.fromisoformat(f"{args.before}-01")
+            # finish (or roll back) the files of an interrupted earlier run first
+            settle_staged_archives(cursor, args.archive_dir)
+            archived = archive_partitions(cursor, before, args.archive_dir)
+            conn.commit()
+            settle_staged_archives(cursor, args.archive_dir)
+            print(f"Archived {len(archived)} partition(s): {', '.join(m.strftime('%Y-%m') for m in archived)}")
+            manifests = write_missing_manifests(args.archive_dir)
+            if manifests:
+                print(f"Wrote manifests for {len(manifests)} earlier archived month(s).")
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # src/ui/auth_pages.py
 import streamlit as st
-from src.auth import authenticate, create_user, reset_password
+from src.auth import authenticate, create_user, reset_password, get_user_profile
 from src.utils import switch_page
 
 def show_login_page(cookies):
@@ -21,6 +21,7 @@ def show_login_page(cookies):
                         st.session_state.user_id = user_id
                         st.session_state.email = email
                         st.session_state.username = username
+                        st.session_state.profile = get_user_profile(user_id)  # primed by authenticate
                         cookies["user_id"] = user_id
                         cookies["email"] = email
                         cookies["username"] = username
@@ -1,9 +1,14 @@
 import streamlit as st
-import time
-from datetime import datetime, timedelta
-from src.expense_manager import get_expenses_as_df 
-
-KHR_TO_USD = 4050
+import calendar
+import re
+from datetime import date, datetime, timedelta
+from src.expense_manager import merchant_totals_query
+from src.async_data import fetch_concurrently
+from src.budget_manager import get_budget_status
+from src.monthly_reports import get_monthly_report, last_closed_month, previous_month
+from src.range_index import compare_periods
+from src.anomaly_detector import get_recent_anomalies
+from src.forecast import get_spending_forecast
 
 def get_user_chat_key(user_id):
     """Generate a unique session state key for each user's chat history"""
@@ -11,25 +16,99 @@ def get_user_chat_key(user_id):
 
 
 def get_last_month_expenses(user_id):
-    """Get user's expenses from last month with currency conversion"""
-    today = datetime.now()
-    first_of_month = today.replace(day=1)
-    last_month_end = first_of_month - timedelta(days=1)
-    last_month_start = last_month_end.replace(day=1)
-    
-    df = get_expenses_as_df(user_id, last_month_start, last_month_end)
-    if df.empty:
-        return 0
-        
-    # Convert all amounts to USD for consistency
-    def convert_amount(row):
-        if row['currency'] == 'KHR':
-            return row['amount'] / KHR_TO_USD
-        return row['amount']
-    
-    df['converted_amount'] = df.apply(convert_amount, axis=1)
-    return df['converted_amount'].sum()
+    """Get user's total for last month (in USD) from the precomputed monthly report"""
+    report = get_monthly_report(user_id, last_closed_month())
+    return report["total"]
+
+
+def get_budget_answer(user_id):
+    """Summarise this month's budgets from the running month-to-date totals"""
+    budgets = get_budget_status(user_id, "USD")
+    if not budgets:
+        return "You haven't set any budgets yet. You can add them from the Dashboard."
+
+    over = [b for b in budgets if b["over_budget"]]
+    if over:
+        response = "Yes, you're over budget this month in:\n"
+        for b in over:
+            response += f"- {b['category_label']}: ${b['spent']:,.2f} of ${b['limit']:,.2f} ({b['percent']:.0f}%)\n"
+    else:
+        response = "No, you're within all your budgets this month:\n"
+        for b in budgets:
+            response += f"- {b['category_label']}: {b['percent']:.0f}% used\n"
+    return response
+
+def month_period(month):
+    """(first day, last day) of the month starting at `month`"""
+    return month, month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def parse_compared_months(prompt_lower, today=None):
+    """Pick the two months named in a prompt (most recent past occurrence of each).
+    Falls back to last month vs this month."""
+    today = today or date.today()
+    names = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+    names.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+    found = [names[w] for w in re.findall(r"[a-z]+", prompt_lower) if w in names]
+    months = []
+    for m in found[:2]:
+        year = today.year if m <= today.month else today.year - 1
+        months.append(date(year, m, 1))
+    if len(months) < 2:
+        this_month = today.replace(day=1)
+        return previous_month(this_month), this_month
+    return tuple(sorted(months))
+
+
+def get_comparison_answer(user_id, prompt_lower):
+    """Compare two months using the prefix-sum range index"""
+    month_a, month_b = parse_compared_months(prompt_lower)
+    result = compare_periods(user_id, month_period(month_a), month_period(month_b), "USD")
+    label_a, label_b = month_a.strftime("%B %Y"), month_b.strftime("%B %Y")
+    response = (
+        f"You spent **${result['a']:,.2f}** in {label_a} and **${result['b']:,.2f}** in {label_b} "
+        f"({'up' if result['delta'] >= 0 else 'down'} ${abs(result['delta']):,.2f}"
+    )
+    if result["pct_change"] is not None:
+        response += f", {result['pct_change']:+.1f}%"
+    response += ").\n"
+    movers = sorted(result["by_category"].items(), key=lambda kv: -abs(kv[1]["delta"]))[:3]
+    if movers:
+        response += "Biggest changes:\n"
+        for category, change in movers:
+            response += f"- {category}: {'+' if change['delta'] >= 0 else '-'}${abs(change['delta']):,.2f}\n"
+    return response
+
+def get_anomaly_answer(user_id):
+    """List recently flagged unusual expenses (flags are kept up to date as expenses are added)"""
+    anomalies = get_recent_anomalies(user_id, date.today() - timedelta(days=30))
+    if not anomalies:
+        return "Nothing unusual in the last 30 days. Your spending looks consistent with your usual patterns."
+    response = "Here's the unusual spending I noticed in the last 30 days:\n"
+    for entry_date, category, merchant, amount, expected, score in anomalies:
+        where = f" at {merchant}" if merchant else ""
+        response += (
+            f"- {entry_date:%b %d}: ${amount:,.2f} on {category}{where} "
+            f"(you usually spend about ${expected:,.2f})\n"
+        )
+    return response
 
+def get_forecast_answer(user_id):
+    """Project this month's and next month's spending from the cached forecast"""
+    forecast = get_spending_forecast(user_id, "USD")
+    low, high = forecast["month_end_band"]
+    response = (
+        f"So far this month you've spent **${forecast['month_to_date']:,.2f}**. "
+        f"At your recent pace you'll end the month at about **${forecast['month_end']:,.2f}** "
+        f"(likely between ${low:,.2f} and ${high:,.2f}).\n"
+    )
+    top = sorted(forecast["month_end_by_category"].items(), key=lambda kv: -kv[1])[:3]
+    if top:
+        response += "Biggest categories by month end:\n"
+        for category, amount in top:
+            response += f"- {category}: ${amount:,.2f}\n"
+    response += f"Next month is on track for about ${forecast['next_month']:,.2f}."
+    return response
 
 
 def show_chatbot_page():
@@ -120,55 +199,59 @@ def show_chatbot_page():
         st.session_state[chat_key].append({"role": "user", "content": prompt})
         
         with st.spinner("Analyzing..."):
-            time.sleep(3)
-        
-        # Bot response logic
-        prompt_lower = prompt.lower()
-        bot_response = ""
-
-        try:
-            if "hello" in prompt_lower or "hi" in prompt_lower:
-                bot_response = f"Hello {st.session_state.username}! How can I help you with your finances today?"
-
-            elif "how much" in prompt_lower and "last month" in prompt_lower:
-                last_month_total = get_last_month_expenses(st.session_state.user_id)
-                bot_response = (
-                    f"Last month, you spent **${last_month_total:,.2f}** "
-                    f"(converted to USD for consistency)."
-                )
-
-            elif "top" in prompt_lower and ("merchant" in prompt_lower or "stores" in prompt_lower):
-                df = get_expenses_as_df(st.session_state.user_id, 
-                                     (datetime.now() - timedelta(days=30)).date(),
-                                     datetime.now().date())
-                
-                # Convert amounts to USD
-                df['converted_amount'] = df.apply(
-                    lambda x: x['amount'] / KHR_TO_USD if x['currency'] == 'KHR' else x['amount'], 
-                    axis=1
-                )
-                
-                top_merchants = df.groupby('merchant_name')['converted_amount'].sum().nlargest(5)
+            # Bot response logic
+            prompt_lower = prompt.lower()
+            bot_response = ""
+
+            try:
+                if "budget" in prompt_lower:
+                    bot_response = get_budget_answer(st.session_state.user_id)
+
+                elif "will i spend" in prompt_lower or "forecast" in prompt_lower or "project" in prompt_lower:
+                    bot_response = get_forecast_answer(st.session_state.user_id)
+
+                elif "unusual" in prompt_lower or "anomal" in prompt_lower or "suspicious" in prompt_lower:
+                    bot_response = get_anomaly_answer(st.session_state.user_id)
+
+                elif "compare" in prompt_lower:
+                    bot_response = get_comparison_answer(st.session_state.user_id, prompt_lower)
+
+                elif "hello" in prompt_lower or "hi" in prompt_lower:
+                    bot_response = f"Hello {st.session_state.username}! How can I help you with your finances today?"
+
+                elif "how much" in prompt_lower and "last month" in prompt_lower:
+                    last_month_total = get_last_month_expenses(st.session_state.user_id)
+                    bot_response = (
+                        f"Last month, you spent **${last_month_total:,.2f}** "
+                        f"(converted to USD for consistency)."
+                    )
+
+                elif "top" in prompt_lower and ("merchant" in prompt_lower or "stores" in prompt_lower):
+                    top_merchants = fetch_concurrently({
+                        "merchants": merchant_totals_query(st.session_state.user_id,
+                                                           (datetime.now() - timedelta(days=30)).date(),
+                                                           datetime.now().date(), "USD")
+                    })["merchants"]
                 
-                bot_response = "Here are your top 5 merchants by spending (in USD):\n"
-                for i, (merchant, amount) in enumerate(top_merchants.items(), 1):
-                    bot_response += f"{i}. {merchant}: ${amount:,.2f}\n"
-            elif "compare" in prompt_lower and ("may" in prompt_lower or "june" in prompt_lower):
-                # Implement actual comparison logic here
-                bot_response = "I'll help you compare those months. Feature coming soon!"
-
-            elif "thank" in prompt_lower:
-                bot_response = "You're welcome! Is there anything else you'd like to know about your finances?"
-
-            else:
-                bot_response = "I'm not sure about that. I can help you with:\n" + \
-                             "- Spending analysis\n" + \
-                             "- Top merchants\n" + \
-                             "- Monthly comparisons"
-
-        except Exception as e:
-            bot_response = "I encountered an error while analyzing your data. Please try again."
-            st.error(f"Error: {str(e)}")
+                    bot_response = "Here are your top 5 merchants by spending (in USD):\n"
+                    for i, (merchant, amount) in enumerate(zip(top_merchants["merchant_name"], top_merchants["converted_amount"]), 1):
+                        bot_response += f"{i}. {merchant}: ${amount:,.2f}\n"
+
+                elif "thank" in prompt_lower:
+                    bot_response = "You're welcome! Is there anything else you'd like to know about your finances?"
+
+                else:
+                    bot_response = "I'm not sure about that. I can help you with:\n" + \
+                                 "- Spending analysis\n" + \
+                                 "- Top merchants\n" + \
+                                 "- Monthly comparisons\n" + \
+                                 "- Budget checks\n" + \
+                                 "- Unusual spending\n" + \
+                                 "- Spending forecasts"
+
+            except Exception as e:
+                bot_response = "I encountered an error while analyzing your data. Please try again."
+                st.error(f"Error: {str(e)}")
 
         # Add bot response to chat history
         st.session_state[chat_key].append({"role": "assistant", "content": bot_response})
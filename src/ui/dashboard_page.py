@@ -1,70 +1,128 @@
 import streamlit as st
 import plotly.express as px
-import pandas as pd
-from datetime import datetime
-from src.expense_manager import get_expenses_as_df
-
-# Constants for currency conversion
-KHR_TO_USD = 4050  # Update this rate as needed
-
-def convert_to_currency(amount, from_currency, to_currency):
-    if from_currency == to_currency:
-        return amount
-    if from_currency == 'KHR' and to_currency == 'USD':
-        return amount / KHR_TO_USD
-    if from_currency == 'USD' and to_currency == 'KHR':
-        return amount * KHR_TO_USD
-    return amount
-
-
-@st.cache_data
-def process_expense_data(df, start_date, end_date, display_currency):
-    """Process and filter expense data with caching"""
-    if df.empty:
-        return pd.DataFrame()
-
-    # Convert dates and filter
-    df = df.copy()
-    df['entry_date'] = pd.to_datetime(df['entry_date']).dt.date
-    df = df[(df['entry_date'] >= start_date) & (df['entry_date'] <= end_date)]
-
-    if df.empty:
-        return df
-
-    # Convert amounts
-    df['converted_amount'] = df.apply(
-        lambda x: convert_to_currency(x['amount'], x['currency'], display_currency),
-        axis=1
-    )
+import plotly.graph_objects as go
+from datetime import date, timedelta
+from src.expense_manager import get_expense_date_bounds, get_dashboard_data
+from src.utils import CATEGORIES_DATA, CURRENCY_OPTIONS
+from src.budget_manager import get_budget_status, set_budget, delete_budget
+from src.range_index import compare_periods
+from src.forecast import get_spending_forecast
+from src.ledger_manager import get_user_ledgers, get_ledger_date_bounds, get_ledger_dashboard
+
+def _show_budget_section(display_currency, currency_symbol):
+    """Month-to-date spend against each category budget."""
+    st.subheader("This Month's Budgets")
+    try:
+        budgets = get_budget_status(st.session_state.user_id, display_currency)
+    except Exception as e:
+        st.error(f"Couldn't load your budgets right now ({type(e).__name__}). Please try again.")
+        budgets = None
+    if budgets == []:
+        st.info("No budgets set yet. Add one below to track your monthly spending.")
+    for budget in budgets or []:
+        label = (
+            f"{budget['category_label']}: {currency_symbol}{budget['spent']:,.2f} of "
+            f"{currency_symbol}{budget['limit']:,.2f} ({budget['percent']:.0f}% of budget)"
+        )
+        if budget["over_budget"]:
+            label = f"⚠️ {label}"
+        st.progress(min(budget["percent"], 100) / 100, text=label)
 
-    # Clean merchant names
-    df['merchant_name'] = df['merchant_name'].fillna('Other')
-    df.loc[df['merchant_name'].str.strip() == '', 'merchant_name'] = 'Other'
+    with st.expander("⚙️ Manage Budgets"):
+        with st.form("budget_form"):
+            b_col1, b_col2, b_col3 = st.columns([2, 2, 1])
+            category = b_col1.selectbox("Category", list(CATEGORIES_DATA.keys()))
+            monthly_limit = b_col2.number_input("Monthly Limit", min_value=0.01, value=100.0, format="%.2f")
+            currency = b_col3.selectbox("Currency", CURRENCY_OPTIONS)
+            s_col1, s_col2 = st.columns(2)
+            if s_col1.form_submit_button("💾 Save Budget", use_container_width=True):
+                set_budget(st.session_state.user_id, category, monthly_limit, currency)
+                st.rerun()
+            if s_col2.form_submit_button("🗑️ Remove Budget", use_container_width=True):
+                delete_budget(st.session_state.user_id, category)
+                st.rerun()
 
-    return df
+def _show_ledger_dashboard(ledger_id, ledger_name):
+    """Group view of a shared ledger, read from its materialized daily totals."""
+    user_id = st.session_state.user_id
+    earliest_date, latest_date = get_ledger_date_bounds(ledger_id, user_id)
+    if earliest_date is None:
+        st.warning(f"No expenses in {ledger_name} yet. Members can add them from the Expense tab.")
+        return
 
-@st.cache_data
-def get_initial_data(_user_id, start_date, end_date):
-    """Fetch initial data with caching"""
-    return get_expenses_as_df(_user_id, start_date, end_date)
+    col1, col2, col3 = st.columns([2, 2, 1])
+    start_date = col1.date_input("Start Date", value=earliest_date, min_value=earliest_date,
+                                 max_value=latest_date, key=f"ledger_start_date_{ledger_id}")
+    end_date = col2.date_input("End Date", value=latest_date, min_value=earliest_date,
+                               max_value=latest_date, key=f"ledger_end_date_{ledger_id}")
+    display_currency = col3.selectbox("Currency", options=['USD', 'KHR'], key="ledger_currency_selector")
+    if start_date > end_date:
+        st.error("Error: Start date cannot be after end date.")
+        return
+
+    try:
+        data = get_ledger_dashboard(ledger_id, user_id, start_date, end_date, display_currency)
+    except Exception as e:
+        st.error(f"Couldn't load the group dashboard right now ({type(e).__name__}). Please try again.")
+        return
+    summary = data["summary"].iloc[0]
+    if summary["transactions"] == 0:
+        st.warning("No expense data available for the selected period.")
+        return
+    currency_symbol = "៛" if display_currency == "KHR" else "$"
+
+    st.markdown("---")
+    m_col1, m_col2, m_col3, m_col4 = st.columns(4)
+    m_col1.metric("Group Total", f"{currency_symbol}{summary['total']:,.2f}")
+    m_col2.metric("Average Daily", f"{currency_symbol}{summary['total'] / max(summary['active_days'], 1):,.2f}")
+    m_col3.metric("Transactions", int(summary["transactions"]))
+    m_col4.metric("Top Spend Category", data["categories"]["category_label"].iloc[0] if not data["categories"].empty else "N/A")
+    st.markdown("---")
+
+    st.subheader("Group Expense Trends")
+    fig_line = px.area(
+        data["daily"], x='entry_date', y='converted_amount',
+        title=f'Daily Expenses in {ledger_name} ({display_currency})',
+        labels={"entry_date": "Date", "converted_amount": f"Amount ({display_currency})"}
+    )
+    fig_line.update_layout(yaxis_tickformat=',.0f')
+    st.plotly_chart(fig_line, use_container_width=True)
+
+    v_col1, v_col2 = st.columns(2)
+    with v_col1:
+        st.subheader("Category Distribution")
+        fig_pie = px.pie(data["categories"], values="converted_amount", names="category_label",
+                         title=f'Expenses by Category ({display_currency})', hole=.3)
+        fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+        st.plotly_chart(fig_pie, use_container_width=True)
+    with v_col2:
+        st.subheader("Spend by Member")
+        members = data["members"].sort_values("converted_amount")
+        fig_bar = px.bar(
+            x=members["converted_amount"], y=members["username"], orientation='h',
+            title=f'Spend by Member ({display_currency})',
+            labels={'x': f'Amount ({display_currency})', 'y': 'Member'}
+        )
+        fig_bar.update_layout(xaxis_tickformat=',.0f')
+        st.plotly_chart(fig_bar, use_container_width=True)
 
 def show_dashboard_page():
     st.header("📈 Expense Dashboard")
 
-    # Load initial data with caching
-    initial_start_date = datetime(2000, 1, 1).date()
-    initial_end_date = datetime.now().date()
-    
-    all_df = get_initial_data(st.session_state.user_id, initial_start_date, initial_end_date)
+    ledgers = {l["ledger_id"]: l["name"] for l in get_user_ledgers(st.session_state.user_id)}
+    if ledgers:
+        view = st.selectbox("View", [None] + list(ledgers), key="dashboard_view",
+                            format_func=lambda l: "My Expenses" if l is None else f"👥 {ledgers[l]}")
+        if view is not None:
+            _show_ledger_dashboard(view, ledgers[view])
+            return
+
+    earliest_date, latest_date = get_expense_date_bounds(st.session_state.user_id)
     
-    if all_df.empty:
+    if earliest_date is None:
         st.warning("No expense data found. Add some expenses to see the dashboard.")
         return
 
-    # Get date range
-    earliest_date = pd.to_datetime(all_df['entry_date']).dt.date.min()
-    latest_date = pd.to_datetime(all_df['entry_date']).dt.date.max()
-
     # --- Filters ---
     col1, col2, col3 = st.columns([2, 2, 1])
     with col1:
@@ -94,37 +152,50 @@ def show_dashboard_page():
         st.error("Error: Start date cannot be after end date.")
         return
 
-    # Process data with caching
-    df = process_expense_data(all_df, start_date, end_date, display_currency)
+    # Daily series, counts and merchant totals are fetched concurrently;
+    # period totals come from the prefix-sum index
+    period_days = (end_date - start_date).days + 1
+    previous_period = (start_date - timedelta(days=period_days), start_date - timedelta(days=1))
+    try:
+        data = get_dashboard_data(st.session_state.user_id, start_date, end_date, display_currency)
+        comparison = compare_periods(st.session_state.user_id, previous_period, (start_date, end_date), display_currency)
+    except Exception as e:
+        st.error(f"Couldn't load the dashboard right now ({type(e).__name__}). Please try again or pick a shorter date range.")
+        return
+    summary = data["summary"].iloc[0]
     
-    if df.empty:
+    if summary["transactions"] == 0:
         st.warning("No expense data available for the selected period.")
         return
 
     # Set currency symbol
     currency_symbol = "៛" if display_currency == "KHR" else "$"
-    
-    # Replace blank merchant names with 'Other'
-    df['merchant_name'] = df['merchant_name'].fillna('Other')
-    df.loc[df['merchant_name'].str.strip() == '', 'merchant_name'] = 'Other'
-
 
     # --- Display Metrics ---
     st.markdown("---")
     m_col1, m_col2, m_col3, m_col4 = st.columns(4)
-    total_expenses = df['converted_amount'].sum()
-    avg_daily = df.groupby('entry_date')['converted_amount'].sum().mean()
-    top_category = df.groupby('category_label')['converted_amount'].sum().idxmax()
+    total_expenses = comparison["b"]
+    avg_daily = total_expenses / summary["active_days"]
+    category_totals = {c: v["b"] for c, v in comparison["by_category"].items() if v["b"]}
+    top_category = max(category_totals, key=category_totals.get, default="N/A")
     
-    m_col1.metric("Total Expenses", f"{currency_symbol}{total_expenses:,.2f}")
+    m_col1.metric(
+        "Total Expenses",
+        f"{currency_symbol}{total_expenses:,.2f}",
+        delta=f"{comparison['delta']:,.2f} vs previous {period_days} days",
+        delta_color="inverse"
+    )
     m_col2.metric("Average Daily", f"{currency_symbol}{avg_daily:,.2f}")
-    m_col3.metric("Transactions", len(df))
+    m_col3.metric("Transactions", int(summary["transactions"]))
     m_col4.metric("Top Spend Category", top_category)
     # m_col4.metric("Categories", df['category_label'].nunique())
     st.markdown("---")
 
+    _show_budget_section(display_currency, currency_symbol)
+    st.markdown("---")
+
     st.subheader("Expense Trends Over Time")
-    daily_expenses = df.groupby('entry_date')['converted_amount'].sum().reset_index()
+    daily_expenses = data["daily"]
     fig_line = px.area(
         daily_expenses,
         x='entry_date',
@@ -140,16 +211,43 @@ def show_dashboard_page():
         xaxis_title="Date",
         yaxis_tickformat = ',.0f' # This line prevents abbreviations like 'k'
     )
+    # Forecast band for the rest of the current month when the range reaches it
+    try:
+        forecast = get_spending_forecast(st.session_state.user_id, display_currency)
+    except Exception:
+        forecast = None  # the chart and totals are still worth showing without it
+    if forecast is not None and end_date >= date.today().replace(day=1) and not forecast["daily_forecast"].empty:
+        upcoming = forecast["daily_forecast"]
+        fig_line.add_trace(go.Scatter(
+            x=upcoming["entry_date"], y=upcoming["upper"], mode="lines",
+            line=dict(width=0), showlegend=False, hoverinfo="skip"
+        ))
+        fig_line.add_trace(go.Scatter(
+            x=upcoming["entry_date"], y=upcoming["lower"], mode="lines", line=dict(width=0),
+            fill="tonexty", fillcolor="rgba(99, 110, 250, 0.2)", name="Forecast range"
+        ))
+        fig_line.add_trace(go.Scatter(
+            x=upcoming["entry_date"], y=upcoming["expected"], mode="lines",
+            line=dict(dash="dash"), name="Forecast"
+        ))
     st.plotly_chart(fig_line, use_container_width=True)
+    if forecast is None:
+        st.caption("📈 The spending forecast is unavailable right now.")
+    else:
+        low, high = forecast["month_end_band"]
+        st.caption(
+            f"📈 Projected spend this month: {currency_symbol}{forecast['month_end']:,.2f} "
+            f"(likely {currency_symbol}{low:,.2f} – {currency_symbol}{high:,.2f}); "
+            f"next month: {currency_symbol}{forecast['next_month']:,.2f}"
+        )
 
     # --- Visualizations ---
     v_col1, v_col2 = st.columns(2)
     with v_col1:
         st.subheader("Category Distribution")
-        category_totals = df.groupby('category_label')['converted_amount'].sum()
         fig_pie = px.pie(
-            values=category_totals.values,
-            names=category_totals.index,
+            values=list(category_totals.values()),
+            names=list(category_totals.keys()),
             title=f'Expenses by Category ({display_currency})',
             hole=.3
         )
@@ -158,10 +256,10 @@ def show_dashboard_page():
 
     with v_col2:
         st.subheader("Top Merchants")
-        merchant_totals = df.groupby('merchant_name')['converted_amount'].sum().nlargest(5).sort_values()
+        merchant_totals = data["merchants"].sort_values("converted_amount")
         fig_bar = px.bar(
-            x=merchant_totals.values,
-            y=merchant_totals.index,
+            x=merchant_totals["converted_amount"],
+            y=merchant_totals["merchant_name"],
             orientation='h',
             title=f'Top 5 Merchants by Spend ({display_currency})',
             labels={'x': f'Amount ({display_currency})', 'y': 'Merchant'}
@@ -1,5 +1,7 @@
 # src/ui/expense_page.py
 import streamlit as st
+import numpy as np
+import pandas as pd
 from datetime import date
 from src.utils import CATEGORIES_DATA, PAYMENT_METHODS, CURRENCY_OPTIONS
 from src.expense_manager import (
@@ -7,8 +9,35 @@ from src.expense_manager import (
     update_expense,
     delete_expense,
     get_expense_by_id,
-    get_expenses_as_df
+    get_expenses_as_df,
+    apply_pending_mutations,
+    report_finished_mutations
 )
+from src.anomaly_detector import get_expense_anomalies
+from src.categorizer import suggest_category, categorize_frame
+from src.ledger_manager import get_user_ledgers
+from src.range_index import data_version
+
+IMPORT_COLUMNS = ["entry_date", "amount", "currency", "merchant_name", "item_description_raw", "payment_method"]
+
+def _selected_expense(id_key, row_key):
+    """Row for the expense being edited/deleted, kept in session state across reruns."""
+    item_id = st.session_state.get(id_key)
+    row = st.session_state.get(row_key)
+    if row is None or str(row["item_id"]) != str(item_id):
+        row = get_expense_by_id(item_id, st.session_state.user_id)
+        st.session_state[row_key] = row
+    return row
+
+def _ledger_selector(current=None, key=None):
+    """Personal or one of the user's shared ledgers; hidden when the user has none."""
+    ledgers = {l["ledger_id"]: l["name"] for l in get_user_ledgers(st.session_state.user_id)}
+    if not ledgers:
+        return None
+    current = int(current) if pd.notna(current) and int(current) in ledgers else None
+    options = [None] + list(ledgers)
+    return st.selectbox("👥 Ledger", options, index=options.index(current),
+                        format_func=lambda l: "Personal" if l is None else ledgers[l], key=key)
 
 def _show_expense_form(expense_data=None):
     is_edit_mode = expense_data is not None
@@ -21,31 +50,93 @@ def _show_expense_form(expense_data=None):
     with col2:
         merchant_name = st.text_input("🏪 Merchant", value=expense_data['merchant_name'] if is_edit_mode else "", max_chars=30)
         all_categories = list(CATEGORIES_DATA.keys())
-        cat_index = all_categories.index(expense_data['category_label']) if is_edit_mode else 0
+        # Suggest a category from the user's history as they type (new expenses only)
+        suggestion = None if is_edit_mode else suggest_category(
+            st.session_state.user_id, merchant_name, st.session_state.get("new_expense_description", "")
+        )
+        if is_edit_mode:
+            cat_index = all_categories.index(expense_data['category_label'])
+        else:
+            cat_index = all_categories.index(suggestion[0]) if suggestion else 0
         selected_category = st.selectbox("📂 Category", all_categories, index=cat_index)
         sub_categories = CATEGORIES_DATA[selected_category]
-        sub_cat_index = sub_categories.index(expense_data['sub_category']) if is_edit_mode and expense_data['sub_category'] in sub_categories else 0
+        if is_edit_mode:
+            sub_cat_index = sub_categories.index(expense_data['sub_category']) if expense_data['sub_category'] in sub_categories else 0
+        else:
+            sub_cat_index = sub_categories.index(suggestion[1]) if suggestion and suggestion[1] in sub_categories else 0
         selected_sub_category = st.selectbox("📁 Sub-Category", sub_categories, index=sub_cat_index)
+        if suggestion:
+            st.caption(f"💡 Suggested from your history: {suggestion[0]} › {suggestion[1]}")
     
-    item_description = st.text_area("📝 Description", value=expense_data['item_description_raw'] if is_edit_mode else "", max_chars=70)
+    item_description = st.text_area(
+        "📝 Description",
+        value=expense_data['item_description_raw'] if is_edit_mode else "",
+        max_chars=70,
+        key=None if is_edit_mode else "new_expense_description"
+    )
     pay_method_index = PAYMENT_METHODS.index(expense_data['payment_method']) if is_edit_mode and expense_data['payment_method'] in PAYMENT_METHODS else 0
     payment_method = st.selectbox("💳 Payment Method", PAYMENT_METHODS, index=pay_method_index)
+    ledger_id = _ledger_selector(expense_data.get('ledger_id') if is_edit_mode else None)
 
     if is_edit_mode:
         if st.button("💾 Update Expense"):
-            update_expense(expense_data['item_id'], st.session_state.user_id, entry_date, amount, currency, merchant_name, selected_category, selected_sub_category, payment_method, item_description)
+            update_expense(expense_data['item_id'], st.session_state.user_id, entry_date, amount, currency, merchant_name, selected_category, selected_sub_category, payment_method, item_description, ledger_id)
             st.session_state.editing_expense_id = None
             st.rerun()
     else:
         if st.button("✅ Add Expense"):
-            add_expense(st.session_state.user_id, entry_date, amount, currency, merchant_name, selected_category, selected_sub_category, payment_method, item_description)
+            add_expense(st.session_state.user_id, entry_date, amount, currency, merchant_name, selected_category, selected_sub_category, payment_method, item_description, ledger_id)
             st.session_state.show_add_form = False
             st.rerun()
 
-def _show_expense_history(df):
+def _show_import_form():
+    uploaded = st.file_uploader("📤 Upload CSV", type="csv")
+    st.caption(
+        f"Columns: {', '.join(IMPORT_COLUMNS)}. Optional: category_label, sub_category "
+        "(blank or unknown categories are filled in from your history)."
+    )
+    if not uploaded:
+        return
+    df = pd.read_csv(uploaded, dtype={"merchant_name": str, "item_description_raw": str})
+    missing_columns = [c for c in ["entry_date", "amount", "merchant_name"] if c not in df.columns]
+    if missing_columns:
+        st.error(f"Missing required columns: {', '.join(missing_columns)}")
+        return
+
+    # rows the add form would reject (bad dates, missing or non-positive amounts) are skipped
+    df["entry_date"] = pd.to_datetime(df["entry_date"], errors="coerce").dt.date
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
+    invalid = df["entry_date"].isna() | ~np.isfinite(df["amount"]) | (df["amount"] < 0.01)
+    if invalid.any():
+        st.warning(f"Skipping {int(invalid.sum())} row(s) with an invalid date or an amount that is missing or not positive "
+                   f"(CSV lines {', '.join(str(i + 2) for i in df.index[invalid][:10])}{'…' if invalid.sum() > 10 else ''}).")
+        df = df[~invalid].reset_index(drop=True)
+    if df.empty:
+        return
+    df["amount"] = df["amount"].round(2)
+    df["currency"] = df["currency"].where(df["currency"].isin(CURRENCY_OPTIONS), CURRENCY_OPTIONS[0]) if "currency" in df else CURRENCY_OPTIONS[0]
+    df["payment_method"] = df["payment_method"].where(df["payment_method"].isin(PAYMENT_METHODS), "Other") if "payment_method" in df else "Other"
+    df["merchant_name"] = df["merchant_name"].fillna("")
+    df["item_description_raw"] = df["item_description_raw"].fillna("") if "item_description_raw" in df else ""
+    if "category_label" in df:
+        df.loc[~df["category_label"].isin(CATEGORIES_DATA.keys()), "category_label"] = None
+    df = categorize_frame(st.session_state.user_id, df)
+    invalid_sub = [sub not in CATEGORIES_DATA[cat] for cat, sub in zip(df["category_label"], df["sub_category"])]
+    df.loc[invalid_sub, "sub_category"] = df.loc[invalid_sub, "category_label"].map(lambda c: CATEGORIES_DATA[c][0])
+
+    st.dataframe(df[IMPORT_COLUMNS + ["category_label", "sub_category"]], use_container_width=True, hide_index=True)
+    ledger_id = _ledger_selector(key="import_ledger")
+    if st.button(f"✅ Import {len(df)} Expenses"):
+        for row in df.itertuples(index=False):
+            add_expense(st.session_state.user_id, row.entry_date, float(row.amount), row.currency, row.merchant_name,
+                        row.category_label, row.sub_category, row.payment_method, row.item_description_raw, ledger_id)
+        st.session_state.show_import_form = False
+        st.rerun()
+
+def _show_expense_history(df, anomalies=None):
     if st.session_state.get("deleting_expense_id"):
         item_id = st.session_state.deleting_expense_id
-        expense = get_expense_by_id(item_id, st.session_state.user_id)
+        expense = _selected_expense("deleting_expense_id", "deleting_expense")
         st.warning("⚠️ Delete Record Confirmation")
         st.markdown(f"Are you sure you want to delete the expense from **{expense['entry_date']}** for **{expense['amount']:.2f} {expense['currency']}**?")
         c1, c2 = st.columns(2)
@@ -73,23 +164,36 @@ def _show_expense_history(df):
         item_id = row["item_id"]
         cols = st.columns([2, 2, 2, 2, 2, 3, 2, 1, 1])
         cols[0].text(row["entry_date"].strftime("%Y-%m-%d"))
-        cols[1].text(f"{row['amount']:.2f} {row['currency']}")
+        anomaly = (anomalies or {}).get(str(item_id))
+        if anomaly:
+            cols[1].markdown(
+                f":red[**{row['amount']:.2f} {row['currency']}**] ⚠️",
+                help=f"Unusual for {row['category_label']}: you typically spend about ${anomaly['expected_usd']:,.2f} here."
+            )
+        else:
+            cols[1].text(f"{row['amount']:.2f} {row['currency']}")
         cols[2].text(row["merchant_name"])
         cols[3].text(row["category_label"])
         cols[4].text(row["sub_category"])
         cols[5].text(row["item_description_raw"], help=row["item_description_raw"] or "No description")
         cols[6].text(row["payment_method"])
+        if row.get("archived") == True:
+            cols[7].markdown("🔒", help="Archived months are read-only.")
+            continue
         if cols[7].button("✏️", key=f"edit_{item_id}", help="Edit"):
             st.session_state.editing_expense_id = item_id
+            st.session_state.editing_expense = row.to_dict()
             st.rerun()
         if cols[8].button("🗑️", key=f"delete_{item_id}", help="Delete"):
             st.session_state.deleting_expense_id = item_id
+            st.session_state.deleting_expense = row.to_dict()
             st.rerun()
 
 def show_expense_page():
+    report_finished_mutations()
     if st.session_state.get("editing_expense_id"):
         st.markdown("### ✏️ Edit Expense")
-        expense_to_edit = get_expense_by_id(st.session_state.editing_expense_id, st.session_state.user_id)
+        expense_to_edit = _selected_expense("editing_expense_id", "editing_expense")
         if expense_to_edit:
             _show_expense_form(expense_data=expense_to_edit)
             if st.button("❌ Cancel Edit"):
@@ -101,10 +205,20 @@ def show_expense_page():
         if st.button("❌ Close Form"):
             st.session_state.show_add_form = False
             st.rerun()
+    elif st.session_state.get("show_import_form"):
+        st.markdown("### 📤 Import Expenses")
+        _show_import_form()
+        if st.button("❌ Close Import"):
+            st.session_state.show_import_form = False
+            st.rerun()
     else:
-        if st.button("➕ Add New Expense"):
+        b_col1, b_col2, _ = st.columns([1, 1, 4])
+        if b_col1.button("➕ Add New Expense"):
             st.session_state.show_add_form = True
             st.rerun()
+        if b_col2.button("📤 Import CSV"):
+            st.session_state.show_import_form = True
+            st.rerun()
         st.markdown("---")
         st.markdown("### 📊 Expense History")
         
@@ -115,7 +229,10 @@ def show_expense_page():
         if start_date > end_date:
             st.warning("Start date cannot be after end date.")
         else:
-            df = get_expenses_as_df(st.session_state.user_id, start_date, end_date)
+            # keyed by data version, so a snapshot cached just before a write is never reused after it
+            version = data_version(st.session_state.user_id)
+            df = get_expenses_as_df(st.session_state.user_id, start_date, end_date, version)
+            df = apply_pending_mutations(df, start_date, end_date, version)
             # Add download button
             csv = df.to_csv(index=False).encode('utf-8')
             st.download_button(
@@ -124,4 +241,4 @@ def show_expense_page():
                 file_name=f'expenses_{start_date}_to_{end_date}.csv',
                 mime='text/csv'
             )
-            _show_expense_history(df)
\ No newline at end of file
+            _show_expense_history(df, get_expense_anomalies(st.session_state.user_id, start_date, end_date))
\ No newline at end of file
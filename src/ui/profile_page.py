@@ -1,13 +1,14 @@
 # src/ui/profile_page.py
 import streamlit as st
 from src.auth import update_username
-from src.database import get_connection
+from src.expense_manager import get_expenses_as_df
+from src.ledger_manager import get_user_ledgers, get_ledger_members, create_ledger, add_ledger_member, leave_ledger
 
 def _show_update_username_form(cookies):
     new_username = st.text_input("New Username", value=st.session_state.username, max_chars=30)
     if st.button("✅ Save Changes"):
         if new_username.strip():
-            update_username(st.session_state.user_id, new_username)
+            st.session_state.profile = update_username(st.session_state.user_id, new_username)
             st.session_state.username = new_username
             cookies["username"] = new_username
             cookies.save()
@@ -24,18 +25,12 @@ def _show_user_details():
         st.session_state.show_details = False
 
     if st.session_state.show_details:
-        if 'created_at' not in st.session_state:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT created_at FROM users WHERE user_id = %s", (st.session_state.user_id,))
-            result = cur.fetchone()
-            cur.close()
-            conn.close()
-            st.session_state.created_at = result[0].strftime("%d-%m-%Y") if result else "N/A"
+        profile = st.session_state.profile
+        created_at = profile["created_at"].strftime("%d-%m-%Y") if profile["created_at"] else "N/A"
         
-        st.text_input("User ID", value=st.session_state.user_id, disabled=True)
-        st.text_input("Email", value=st.session_state.email, disabled=True)
-        st.text_input("Register Date", value=st.session_state.created_at, disabled=True)
+        st.text_input("User ID", value=profile["user_id"], disabled=True)
+        st.text_input("Email", value=profile["email"], disabled=True)
+        st.text_input("Register Date", value=created_at, disabled=True)
 
         if st.button("Hide My Details"):
             st.session_state.show_details = False
@@ -45,6 +40,40 @@ def _show_user_details():
             st.session_state.show_details = True
             st.rerun()
 
+def _show_ledgers():
+    st.markdown("---")
+    st.subheader("Shared Ledgers")
+    st.caption("Expenses saved to a shared ledger are visible to every member on the Dashboard.")
+    user_id = st.session_state.user_id
+    for ledger in get_user_ledgers(user_id):
+        is_owner = ledger["role"] == "owner"
+        with st.expander(f"👥 {ledger['name']}" + (" (owner)" if is_owner else "")):
+            for username, email, role in get_ledger_members(ledger["ledger_id"], user_id):
+                st.markdown(f"- **{username}** ({email}){' · owner' if role == 'owner' else ''}")
+            if is_owner:
+                with st.form(f"add_member_{ledger['ledger_id']}", clear_on_submit=True):
+                    email = st.text_input("Member Email")
+                    if st.form_submit_button("➕ Add Member"):
+                        if add_ledger_member(ledger["ledger_id"], user_id, email.strip()):
+                            st.success(f"Added {email.strip()} to {ledger['name']}.")
+                        else:
+                            st.warning("No account found with that email, or it is already a member.")
+            leave_label = "🗑️ Delete Ledger" if is_owner else "🚪 Leave Ledger"
+            if st.button(leave_label, key=f"leave_ledger_{ledger['ledger_id']}"):
+                leave_ledger(ledger["ledger_id"], user_id)
+                # the user's expenses in this ledger are now personal again
+                get_expenses_as_df.clear()
+                st.rerun()
+
+    with st.form("create_ledger", clear_on_submit=True):
+        name = st.text_input("New Ledger Name", max_chars=50)
+        if st.form_submit_button("✅ Create Ledger"):
+            if name.strip():
+                create_ledger(user_id, name.strip())
+                st.rerun()
+            else:
+                st.warning("Ledger name cannot be empty.")
+
 def show_profile_page(cookies):
     """Main function to render the user profile page."""
     st.markdown("## 👤 User Profile Settings")
@@ -57,4 +86,5 @@ def show_profile_page(cookies):
     else:
         st.button("✏️ Update Username", on_click=lambda: st.session_state.update({"show_update_username_form": True}))
     
-    _show_user_details()
\ No newline at end of file
+    _show_user_details()
+    _show_ledgers()
@@ -28,4 +28,16 @@ CATEGORIES_DATA = {
     "Miscellaneous": ["Other"]
 }
 PAYMENT_METHODS = ["Cash", "Mobile Pay", "Credit Card", "Debit Card", "Other"]
-CURRENCY_OPTIONS = ["USD", "KHR"]
\ No newline at end of file
+CURRENCY_OPTIONS = ["USD", "KHR"]
+
+# Constants for currency conversion
+KHR_TO_USD = 4050  # Update this rate as needed
+
+def convert_to_currency(amount, from_currency, to_currency):
+    if from_currency == to_currency:
+        return amount
+    if from_currency == 'KHR' and to_currency == 'USD':
+        return amount / KHR_TO_USD
+    if from_currency == 'USD' and to_currency == 'KHR':
+        return amount * KHR_TO_USD
+    return amount
@@ -0,0 +1,16 @@
+# tests/conftest.py
+"""Unit tests cover the pure cores only.
+
+`src.database` reads .streamlit/secrets.toml at import time, so a stand-in
+without any connection is registered before the modules under test import it.
+"""
+import sys
+import types
+
+def _no_database(*args, **kwargs):
+    raise RuntimeError("unit tests do not touch the database")
+
+_database = types.ModuleType("src.database")
+_database.get_connection = _no_database
+_database.get_db_engine = _no_database
+sys.modules.setdefault("src.database", _database)
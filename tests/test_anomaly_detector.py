@@ -0,0 +1,51 @@
+# tests/test_anomaly_detector.py
+from datetime import date
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("psycopg2")
+from src import anomaly_detector as ad
+
+class _StatsCursor:
+    """Answers the category_stats lookup and records every statement."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((" ".join(sql.split()), params))
+
+    def fetchone(self):
+        return self.stats
+
+    def ran(self, prefix):
+        return [params for sql, params in self.statements if sql.startswith(prefix)]
+
+# ten $20 grocery bills give mean ~log(21) and a small spread
+STATS = (10, float(np.log1p(20.0)), 0.04)
+
+def _rescore(amount, stats=STATS):
+    cursor = _StatsCursor(stats)
+    score = ad.rescore_expense(cursor, "item-1", 1, date(2024, 3, 5), "Food & Groceries", "Lucky Mart", amount, "USD")
+    return cursor, score
+
+def test_rescore_flags_corrected_amount_without_updating_stats():
+    cursor, score = _rescore(900.0)
+    assert score > ad.THRESHOLD
+    assert cursor.ran("DELETE FROM expense_anomalies")
+    (flag,) = cursor.ran("INSERT INTO expense_anomalies")
+    assert flag[0] == "item-1" and flag[5] == 900.0
+    assert not cursor.ran("UPDATE category_stats")
+
+def test_rescore_clears_flag_of_ordinary_amount():
+    cursor, score = _rescore(21.0)
+    assert score < ad.THRESHOLD
+    assert cursor.ran("DELETE FROM expense_anomalies")
+    assert not cursor.ran("INSERT INTO expense_anomalies")
+
+def test_rescore_without_enough_history():
+    cursor, score = _rescore(900.0, stats=(2, 3.0, 0.04))
+    assert score is None
+    assert not cursor.ran("INSERT INTO expense_anomalies")
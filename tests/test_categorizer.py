@@ -0,0 +1,57 @@
+# tests/test_categorizer.py
+import pytest
+
+pytest.importorskip("streamlit")
+from src import categorizer
+from src.categorizer import ExpenseCategorizer
+
+DINING = ("Dining", "Restaurant Meals")
+GROCERIES = ("Food & Groceries", "Vegetables")
+
+def test_known_merchant_wins():
+    model = ExpenseCategorizer()
+    model.learn(["Lucky Mart", "Cafe Soleil"], ["", "latte"], [GROCERIES, DINING])
+    assert model.predict(["LUCKY mart"], [""]) == [GROCERIES]
+
+def test_corrected_merchant_drops_old_label():
+    model = ExpenseCategorizer()
+    model.learn(["Lucky Mart"], [""], [DINING])
+    # an edit unlearns the old row before learning the new one
+    model.unlearn(["Lucky Mart"], [""], [DINING])
+    model.learn(["Lucky Mart"], [""], [GROCERIES])
+    assert model.predict(["Lucky Mart"], [""]) == [GROCERIES]
+
+def test_unlearning_everything_empties_model():
+    model = ExpenseCategorizer()
+    model.learn(["Lucky Mart"], ["veg"], [GROCERIES])
+    model.unlearn(["Lucky Mart"], ["veg"], [GROCERIES])
+    model.unlearn(["Lucky Mart"], ["veg"], [GROCERIES])  # unlearned twice; counts stay at zero
+    assert model.predict(["Lucky Mart"], ["veg"]) == [None]
+    assert (model.counts >= 0).all()
+
+def test_model_store_keeps_most_recently_used(monkeypatch):
+    monkeypatch.setattr(categorizer, "MAX_MODELS", 2)
+    store = {"lock": categorizer.threading.Lock(), "models": categorizer.OrderedDict()}
+    monkeypatch.setattr(categorizer, "_model_store", lambda: store)
+    for user_id in [1, 2]:
+        store["models"][user_id] = ExpenseCategorizer()
+    categorizer.learn_expenses(1, ["Lucky Mart"], [""], [GROCERIES])  # touches user 1
+    monkeypatch.setattr(categorizer, "get_connection", _no_rows_connection)
+    categorizer.get_categorizer(3)
+    assert list(store["models"]) == [1, 3]
+
+class _NoRows:
+    def execute(self, *args):
+        pass
+    def fetchall(self):
+        return []
+    def close(self):
+        pass
+
+def _no_rows_connection():
+    class Connection:
+        def cursor(self):
+            return _NoRows()
+        def close(self):
+            pass
+    return Connection()
@@ -0,0 +1,25 @@
+# tests/test_forecast.py
+from datetime import date, timedelta
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+from src import forecast
+from src.range_index import RangeIndex
+
+def test_fit_levels_constant_series():
+    levels, sigma = forecast.fit_levels(np.full((2, 30), 4.0))
+    np.testing.assert_allclose(levels, [4.0, 4.0])
+    np.testing.assert_allclose(sigma, [0.0, 0.0])
+
+def test_month_end_band_never_below_month_to_date(monkeypatch):
+    today = date(2024, 3, 20)
+    # noisy history up to last month, then one large purchase this month
+    rows = [(today - timedelta(days=d), "USD", "Food", 200.0 * (d % 2)) for d in range(20, 110)]
+    rows.append((date(2024, 3, 2), "USD", "Shopping", 500.0))
+    index = RangeIndex.from_daily_rows(rows, today=today)
+    monkeypatch.setattr(forecast, "get_range_index", lambda user_id: index)
+    result = forecast._forecast(1, 0, today, "USD")
+    low, high = result["month_end_band"]
+    assert low >= result["month_to_date"] >= 500.0
+    assert low <= result["month_end"] <= high
@@ -0,0 +1,59 @@
+# tests/test_password_hashing.py
+import hashlib
+import pytest
+from src import password_hashing as ph
+
+@pytest.fixture(autouse=True)
+def default_kdf(monkeypatch):
+    monkeypatch.setattr(ph, "KDF", "scrypt")
+
+def test_scrypt_hash_format_and_roundtrip():
+    stored = ph.hash_password("correct horse")
+    parts = stored.split("$")
+    assert parts[0] == "scrypt" and len(parts) == 6
+    assert int(parts[1]) == ph.SCRYPT_N
+    assert ph.verify_password("correct horse", stored) == (True, False)
+    assert ph.verify_password("wrong horse", stored) == (False, False)
+
+def test_salts_differ():
+    assert ph.hash_password("same") != ph.hash_password("same")
+
+def test_legacy_sha256_needs_rehash():
+    legacy = hashlib.sha256(b"old password").hexdigest()
+    assert ph.verify_password("old password", legacy) == (True, True)
+    assert ph.verify_password("other", legacy)[0] is False
+
+def test_outdated_cost_needs_rehash():
+    stored = ph.hash_password("pw", "scrypt", ph.SCRYPT_N // 2)
+    assert ph.verify_password("pw", stored) == (True, True)
+    assert ph.verify_password("nope", stored) == (False, False)
+
+def test_non_default_block_size_still_verifies():
+    salt = b"0123456789abcdef"
+    key = ph._b64(ph._derive("pw", "scrypt", 1024, salt, r=16, p=2))
+    stored = f"scrypt$1024$16$2${ph._b64(salt)}${key}"
+    assert ph.verify_password("pw", stored) == (True, True)
+    assert ph.verify_password("nope", stored) == (False, False)
+
+def test_other_kdf_needs_rehash():
+    stored = ph.hash_password("pw", "pbkdf2_sha256", 1000)
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert ph.verify_password("pw", stored) == (True, True)
+
+def test_current_pbkdf2_when_configured(monkeypatch):
+    monkeypatch.setattr(ph, "KDF", "pbkdf2_sha256")
+    monkeypatch.setattr(ph, "PBKDF2_ITERATIONS", 1000)
+    stored = ph.hash_password("pw")
+    assert ph.verify_password("pw", stored) == (True, False)
+
+@pytest.mark.parametrize("stored", [
+    "",
+    "scrypt$16384$8$1$onlyfive",
+    "scrypt$notanumber$8$1$AAAAAAAAAAAAAAAAAAAAAA==$key",
+    "scrypt$1000$8$1$AAAAAAAAAAAAAAAAAAAAAA==$key",   # N must be a power of two
+    "scrypt$1024$0$1$AAAAAAAAAAAAAAAAAAAAAA==$key",
+    "pbkdf2_sha256$1000$not*base64$key",
+    "md5$salt$hash",
+])
+def test_malformed_hashes_never_match(stored):
+    assert ph.verify_password("pw", stored) == (False, False)
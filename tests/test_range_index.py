@@ -0,0 +1,90 @@
+# tests/test_range_index.py
+from collections import namedtuple
+from datetime import date, timedelta
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+from src.range_index import RangeIndex
+from src.utils import KHR_TO_USD
+
+Delta = namedtuple("Delta", ["user_id", "entry_date", "category_label", "currency", "amount"])
+
+TODAY = date(2024, 3, 31)
+ROWS = [
+    (date(2024, 3, 1), "USD", "Food", 10.0),
+    (date(2024, 3, 2), "USD", "Food", 5.0),
+    (date(2024, 3, 2), "KHR", "Transport", 8100.0),
+    (date(2024, 3, 10), "USD", "Shopping", 20.0),
+]
+
+def _brute_total(rows, start, end, display_currency="USD"):
+    total = 0.0
+    for day, currency, _, amount in rows:
+        if start <= day <= end:
+            if currency == display_currency:
+                total += amount
+            elif currency == "KHR":
+                total += amount / KHR_TO_USD
+            else:
+                total += amount * KHR_TO_USD
+    return total
+
+def test_total_matches_brute_force_over_windows():
+    index = RangeIndex.from_daily_rows(ROWS, today=TODAY)
+    for start, end in [(date(2024, 3, 1), date(2024, 3, 31)), (date(2024, 3, 2), date(2024, 3, 2)),
+                       (date(2024, 3, 3), date(2024, 3, 9)), (date(2024, 2, 1), date(2024, 3, 1))]:
+        assert index.total(start, end) == pytest.approx(_brute_total(ROWS, start, end))
+    assert index.total(date(2024, 3, 1), date(2024, 3, 2), "KHR") == pytest.approx(15.0 * KHR_TO_USD + 8100.0)
+
+def test_window_outside_span_is_empty():
+    index = RangeIndex.from_daily_rows(ROWS, today=TODAY)
+    assert index.total(date(2023, 1, 1), date(2023, 12, 31)) == 0.0
+    assert index.category_totals(date(2025, 1, 1), date(2025, 1, 31)) == {}
+
+def test_category_totals_convert_and_skip_zero():
+    index = RangeIndex.from_daily_rows(ROWS, today=TODAY)
+    totals = index.category_totals(date(2024, 3, 1), date(2024, 3, 5))
+    assert totals == pytest.approx({"Food": 15.0, "Transport": 2.0})
+
+def test_patch_grows_span_and_adds_slots():
+    index = RangeIndex.from_daily_rows(ROWS, today=TODAY)
+    deltas = [
+        Delta("u", date(2024, 2, 20), "Food", "USD", 7.0),        # before origin
+        Delta("u", date(2024, 4, 15), "Health", "USD", 3.0),      # after last day, new category
+        Delta("u", date(2024, 3, 2), "Food", "KHR", 4050.0),      # new currency for a category
+        Delta("u", date(2024, 3, 1), "Food", "USD", -10.0),       # removal
+    ]
+    index.patch(deltas, version=4)
+    rows = ROWS + [(d.entry_date, d.currency, d.category_label, d.amount) for d in deltas]
+    rebuilt = RangeIndex.from_daily_rows(rows, today=TODAY)
+    assert index.version == 4
+    assert index.origin == date(2024, 2, 20)
+    for start, end in [(date(2024, 2, 1), date(2024, 4, 30)), (date(2024, 3, 1), date(2024, 3, 2)),
+                       (date(2024, 4, 1), date(2024, 4, 15)), (date(2024, 2, 20), date(2024, 2, 20))]:
+        assert index.total(start, end) == pytest.approx(rebuilt.total(start, end))
+        assert index.category_totals(start, end) == pytest.approx(rebuilt.category_totals(start, end))
+
+def test_patch_without_version_increments():
+    index = RangeIndex.from_daily_rows(ROWS, today=TODAY)
+    index.patch([Delta("u", date(2024, 3, 5), "Food", "USD", 1.0)])
+    assert index.version == 1
+
+def test_daily_matrix_matches_daily_rows():
+    index = RangeIndex.from_daily_rows(ROWS, today=TODAY)
+    start, end = date(2024, 2, 28), date(2024, 3, 3)
+    categories, daily = index.daily_matrix(start, end)
+    assert daily.shape == (len(categories), (end - start).days + 1)
+    expected = np.zeros_like(daily)
+    for day, currency, category, amount in ROWS:
+        if start <= day <= end:
+            usd = amount / KHR_TO_USD if currency == "KHR" else amount
+            expected[categories.index(category), (day - start).days] += usd
+    np.testing.assert_allclose(daily, expected)
+
+def test_daily_matrix_beyond_span_is_zero():
+    index = RangeIndex.from_daily_rows(ROWS, today=TODAY)
+    start = TODAY + timedelta(days=1)
+    _, daily = index.daily_matrix(start, start + timedelta(days=6))
+    assert daily.shape[1] == 7
+    assert not daily.any()